@@ -1,18 +1,22 @@
+import argparse
 import base64
+import collections
 import json
 import os
 import sys
 import time
-import tempfile
-import urllib.request
 
 from PyQt5 import QtGui, QtWidgets, QtCore
 from PyQt5.QtWidgets import QVBoxLayout, \
-    QHBoxLayout, QGridLayout, QLabel, QLineEdit, QAction, QCheckBox, qApp, \
-    QWidget, QScrollArea
+    QHBoxLayout, QGridLayout, QLabel, QLineEdit, QAction, qApp, \
+    QWidget, QScrollArea, QTableView, QHeaderView, QListView, QSystemTrayIcon
 from PyQt5.QtCore import pyqtSlot, pyqtSignal, QObject
 
-import resources
+from alerts import AlertEngine, format_alert, parse_rule, read_rules
+from currency import FxRates
+from history import HISTORY_DIR, HistoryStore
+from ticker import Backoff, CoinIndex, SnapshotPipeline, TickerClient, \
+    format_value, read_snapshot
 
 """
 This program uses the CoinMarketCap API to retrieve and display information
@@ -104,127 +108,411 @@ pyinstaller --onefile --windowed --icon=resources/logo.ico CryptoCurrencyUpdater
 
 __version__ = "1.0"
 
+# Images decoded from resources, by name
+_pixmaps = dict()
 
-class GetCoinNames(QObject):
-    """This thread returns num_coins number of coins. Recommend returning all
-    coins"""
-    coin_names_signal = pyqtSignal(list)
 
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.root_url = "https://api.coinmarketcap.com/v1/ticker/"
-        self._looping = False
-        self._update_frequency = 60 * 60
+def pixmap(name):
+    """
+    Returns the base64 encoded image stored in resources under name as a
+    QPixmap. resources is only imported and the image only decoded, in
+    memory, on first use.
+    """
+    if name not in _pixmaps:
+        import resources
 
-    @pyqtSlot(name="start")
-    def start(self):
-        pass
+        image = QtGui.QPixmap()
+        image.loadFromData(base64.decodebytes(getattr(resources, name)))
+        _pixmaps[name] = image
+    return _pixmaps[name]
 
-    @QtCore.pyqtSlot(int, name="getCoinNames")
-    def get_coin_names(self, num_coins):
-        # self._looping = True
-        # while self._looping:
-        # TODO: Update how this thread is started/called so that the names get updated every hour
-        with urllib.request.urlopen(self.root_url + "?limit={}"
-                                    "".format(num_coins)) as url:
-            data = json.loads(url.read().decode())
-            tmp_names = list()
 
-            for i in data:
-                tmp_names.append(i["id"])
+def icon(name):
+    return QtGui.QIcon(pixmap(name))
 
-            self.coin_names_signal.emit(tmp_names)
-                # time.sleep(self._update_frequency)
+
+class PollScheduler(QObject):
+    """
+    Runs periodic jobs from single shot timers in the thread it lives in.
+    Each job is rescheduled by its own Backoff, so a job that raises is
+    retried with a growing delay instead of ending the thread, and quitting
+    the thread or calling stop() cancels all pending polls at once. A job
+    that succeeds again after failing is reported on recovered.
+    """
+    failed = pyqtSignal(str, str)
+    recovered = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super(PollScheduler, self).__init__(parent)
+        self._jobs = dict()
+
+    def add(self, name, func, backoff, delay=0):
+        """Runs func after delay seconds and then as backoff says."""
+        timer = QtCore.QTimer(self)
+        timer.setSingleShot(True)
+        timer.timeout.connect(lambda: self._run(name))
+        self._jobs[name] = (func, backoff, timer)
+        timer.start(int(delay * 1000))
+
+    def stop(self):
+        for func, backoff, timer in self._jobs.values():
+            timer.stop()
+        self._jobs.clear()
+
+    def _run(self, name):
+        func, backoff, timer = self._jobs[name]
+        try:
+            func()
+            failed = False
+        except Exception as e:
+            failed = True
+            self.failed.emit(name, "{}: {}".format(type(e).__name__, e))
+
+        if not failed and backoff.failures:
+            self.recovered.emit(name)
+        # The job may have been stopped while it ran
+        if name in self._jobs:
+            timer.start(int(backoff.delay(failed) * 1000))
 
 
 class GetCoinData(QObject):
-    """This thread will fetch the data for the given coin name"""
+    """
+    This thread fetches the ticker for all coins once per update and derives
+    both the list of coin names and the data for every coin from it. Besides
+    the full snapshot it emits the change set against the previous one, see
+    ticker.diff(). Snapshots are appended to the history store if one is
+    given, and as one JSON list per line to the record file if one is given.
+    Prices in the given currencies are added to every coin as price_<code>,
+    converted from USD with exchange rates that are fetched once an hour.
+    Every change set is checked against the rules of the alert engine if one
+    is given, and the alerts that fire on it are sent together as a list of
+    texts on alert_signal.
+    These steps are those of ticker.SnapshotPipeline, shared with headless.py.
+    Polls that fail are retried with exponential backoff and reported on
+    error_signal, which sends an empty string once a poll succeeds again.
+    """
+    coin_names_signal = pyqtSignal(list)
     coin_data_signal = pyqtSignal(dict)
+    coin_delta_signal = pyqtSignal(dict)
+    error_signal = pyqtSignal(str)
+    alert_signal = pyqtSignal(list)
 
-    def __init__(self, parent=None):
+    def __init__(self, client=None, history=None, record=None,
+                 currencies=(), fx=None, alerts=None, parent=None):
         super().__init__(parent)
-        self.root_url = "https://api.coinmarketcap.com/v1/ticker/"
-        self._looping = False
+        self._client = client if client is not None else TickerClient()
+        if fx is None and currencies:
+            fx = FxRates()
+        self._fx = fx
+        self._pipeline = SnapshotPipeline(currencies, fx, alerts, history,
+                                          record)
+        self.currencies = self._pipeline.currencies
+        if alerts is not None:
+            alerts.notify.append(lambda fired: self.alert_signal.emit(
+                [format_alert(alert) for alert in fired]))
+        self._scheduler = None
         self._update_frequency = 5 * 60
+        self._retry = 15
+        self._names = []
+        self._write_failed = False
 
     @pyqtSlot(name="start")
     def start(self):
-        self.get_coin_data()
+        # The scheduler's timers have to be created in the thread they run in
+        self._scheduler = PollScheduler(self)
+        self._scheduler.failed.connect(
+            lambda name, error: self.error_signal.emit(error))
+        self._scheduler.recovered.connect(
+            lambda name: self.error_signal.emit(""))
+        if self._fx is not None:
+            self._scheduler.add("fx", self.update_rates,
+                                Backoff(self._fx.interval, self._retry))
+        self._scheduler.add("ticker", self.get_coin_data,
+                            Backoff(self._update_frequency, self._retry))
+
+    @pyqtSlot(name="stop")
+    def stop(self):
+        """Cancels the pending polls and ends the thread's event loop."""
+        if self._scheduler is not None:
+            self._scheduler.stop()
+        self.thread().quit()
+
+    def cancel(self):
+        """
+        Interrupts a fetch in progress by closing the connections. Unlike the
+        other methods this is called from outside the thread, whose event
+        loop is blocked for as long as the fetch runs.
+        """
+        self._client.close()
+        if self._fx is not None:
+            self._fx.close()
 
-    @QtCore.pyqtSlot(int, name="getCoinData")
+    @QtCore.pyqtSlot(name="getCoinData")
     def get_coin_data(self):
         """
-        This function gets all data for all coins and returns a dict with the
-        coin rank as the dict key. The thread updates regularly based on update
-        frequency.
+        This function gets all data for all coins and emits a dict with the
+        coin rank as the dict key. The scheduler calls it regularly based on
+        update frequency. Polls where the ticker did not change are not
+        emitted, and the coin names, ordered by rank, only when they changed.
+        The change set is only emitted when it is not empty. The snapshot is
+        written to the history store and the record file after it was
+        emitted, and a failed write is reported on error_signal without
+        failing the poll.
+        """
+        data = self._client.get_coins("?limit=0", commit=False)
+
+        if data is not None:
+            self.publish(data)
+            self._client.commit("?limit=0")
+
+            errors = self._pipeline.store(data)
+            if errors or self._write_failed:
+                self.error_signal.emit("; ".join(errors))
+            self._write_failed = bool(errors)
+
+    def update_rates(self):
+        """
+        Fetches the exchange rates and, if they changed, publishes the last
+        snapshot again with the converted prices.
+        """
+        data = self._pipeline.data
+        if self._fx.refresh(force=True) and data is not None:
+            self.publish([coin.copy() for coin in data])
+
+    def publish(self, data):
+        """
+        Emits the signals for a ticker snapshot, given as a list of
+        CoinRecords in rank order. Returns whether a change set was emitted.
+        """
+        delta = self._pipeline.update(data)
+
+        tmp_names = list()
+        tmp_data = dict()
+
+        for i in data:
+            tmp_names.append(i["id"])
+            tmp_data[int(i["rank"])] = i
+
+        self.coin_data_signal.emit(tmp_data)
+        changed = any(delta.values())
+        if changed:
+            self.coin_delta_signal.emit(delta)
+        if tmp_names != self._names:
+            self._names = tmp_names
+            self.coin_names_signal.emit(tmp_names)
+        return changed
+
+
+class ReplayCoinData(GetCoinData):
+    """
+    Stand-in for GetCoinData that replays ticker snapshots recorded with
+    --record at a fixed rate, without network access, to put a deterministic
+    load on the widget.
+
+    A frame is dropped when the timer fell behind or when the consumer has
+    not yet finished max_pending earlier frames. The change set of the next
+    frame that is sent covers the dropped ones. Latency is measured from
+    emitting a change set until the consumer calls frame_done(), which it
+    should do through a direct connection.
+    """
+    finished = pyqtSignal(dict)
+
+    def __init__(self, path, rate=100, frames=0, max_pending=2, alerts=None,
+                 parent=None):
+        super().__init__(alerts=alerts, parent=parent)
+        with open(path) as f:
+            self._snapshots = [read_snapshot(line) for line in f
+                               if line.strip()]
+        self._rate = rate
+        self._frames = frames or len(self._snapshots)
+        self._max_pending = max_pending
+
+        self._timer = None
+        self._frame = 0
+        self._dropped = 0
+        self._start = 0
+        self._end = 0
+        self._pending = collections.deque()
+        self._latency = []
+
+    @pyqtSlot(name="start")
+    def start(self):
+        # The timer has to be created in the thread it runs in
+        self._timer = QtCore.QTimer(self)
+        self._timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self._timer.timeout.connect(self._tick)
+        self._start = time.perf_counter()
+        self._timer.start(max(1, int(1000 / self._rate)))
+
+    @pyqtSlot(name="stop")
+    def stop(self):
+        if self._timer is not None:
+            self._timer.stop()
+        self.thread().quit()
+
+    def _tick(self):
+        if self._frame >= self._frames:
+            if not self._pending:
+                self._timer.stop()
+                self.finished.emit(self.stats())
+            return
+
+        due = min(int((time.perf_counter() - self._start) * self._rate) + 1,
+                  self._frames)
+        if due <= self._frame or len(self._pending) >= self._max_pending:
+            return
+
+        self._dropped += due - self._frame - 1
+        self._frame = due
+        self._pending.append(time.perf_counter())
+        if not self.publish(self._snapshots[(due - 1) %
+                                            len(self._snapshots)]):
+            self._pending.pop()
+        self._end = time.perf_counter()
+
+    def frame_done(self):
+        """Marks the oldest change set as processed by the consumer."""
+        if self._pending:
+            self._latency.append(time.perf_counter() -
+                                 self._pending.popleft())
+
+    def stats(self):
+        """
+        Returns the number of frames replayed, sent and dropped, the rate at
+        which they were sent and the latency in milliseconds.
         """
-        self._looping = True
-        while self._looping:
-            with urllib.request.urlopen(self.root_url + "?limit=0") as url:
-                data = json.loads(url.read().decode())
-                tmp_data = dict()
+        latency = sorted(1000 * t for t in self._latency)
+        seconds = max(self._end - self._start, 1e-9)
+        result = {"frames": self._frame, "sent": len(latency),
+                  "dropped": self._dropped, "seconds": seconds,
+                  "rate": len(latency) / seconds}
+        if latency:
+            result["latency_ms"] = {
+                "mean": sum(latency) / len(latency),
+                "p50": latency[len(latency) // 2],
+                "p95": latency[int(len(latency) * 0.95)],
+                "max": latency[-1]}
+        return result
+
+
+class CoinTableModel(QtCore.QAbstractTableModel):
+    """
+    Table model over a CoinIndex with one row per selected coin, ordered by
+    rank, and one column per coin field. Views only query the rows they
+    paint, and updates are reported as dataChanged ranges over the affected
+    rows.
+    """
 
-                for i in data:
-                    tmp_data[int(i["rank"])] = i
+    def __init__(self, coin_fields, coin_index, parent=None):
+        super(CoinTableModel, self).__init__(parent)
+        self.coin_fields = coin_fields
+        self.coin_index = coin_index
+        self._columns = list(coin_fields)
+        self._ids = []
+        # Row of each coin id
+        self._rows = dict()
 
-                self.coin_data_signal.emit(tmp_data)
-                time.sleep(self._update_frequency)
+    def set_coins(self, ids):
+        """
+        Shows the listed coins among the given ids as the rows of the table,
+        ordered by their current rank.
+        """
+        self.beginResetModel()
+        self._ids = sorted((i for i in ids if i in self.coin_index),
+                           key=self.coin_index.rank)
+        self._rows = {coin_id: row for row, coin_id in enumerate(self._ids)}
+        self.endResetModel()
+
+    def update_coins(self, ids):
+        """
+        Emits dataChanged for the rows of the given coin ids, with one signal
+        per run of adjacent rows.
+        """
+        rows = sorted(self._rows[i] for i in ids if i in self._rows)
+
+        last = len(self._columns) - 1
+        start = None
+        for k, row in enumerate(rows):
+            if start is None:
+                start = row
+            if k + 1 == len(rows) or rows[k + 1] != row + 1:
+                self.dataChanged.emit(self.index(start, 0),
+                                      self.index(row, last))
+                start = None
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._ids)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        coin = self.coin_index.get(self._ids[index.row()], {})
+
+        if role == QtCore.Qt.DisplayRole:
+            return format_value(coin.get(self._columns[index.column()]))
+        if role == QtCore.Qt.ForegroundRole:
+            change = coin.get("percent_change_24h") or 0
+            if change > 0:
+                return QtGui.QBrush(QtCore.Qt.darkGreen)
+            elif change < 0:
+                return QtGui.QBrush(QtCore.Qt.red)
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return self.coin_fields[self._columns[section]]["text"]
+        return str(self.coin_index.rank(self._ids[section]))
 
 
 class MainWindow(QtWidgets.QMainWindow):
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, source=None):
         super(MainWindow, self).__init__(parent)
 
-        self.main_widget = MainWidget(self)
-        self.select_window = SelectCoins(self)
-
-        self.logo_jpg = resources.logo_jpg
-        self.logo = tempfile.NamedTemporaryFile(delete=False)
-        self.logo.write(base64.decodebytes(self.logo_jpg))
-        self.logo.close()
+        self.main_widget = MainWidget(self, source)
+        self.select_window = SelectCoins(self, self.main_widget.coin_index)
 
         self.setWindowTitle("Ryan's CoinWatcher")
 
-        self.setWindowIcon(QtGui.QIcon(self.logo.name))
-        self.main_widget.setWindowIcon(QtGui.QIcon(self.logo.name))
-        self.select_window.setWindowIcon(QtGui.QIcon(self.logo.name))
+        self.setWindowIcon(icon("logo_jpg"))
+        self.main_widget.setWindowIcon(icon("logo_jpg"))
+        self.select_window.setWindowIcon(icon("logo_jpg"))
+
+        # Created on the first alert
+        self._tray = None
 
         self.__controls()
         self.__layout()
         self.__signals()
 
     def __controls(self):
-        self._exit_png = resources.exit_png
-        self._exit = tempfile.NamedTemporaryFile(delete=False)
-        self._exit.write(base64.decodebytes(self._exit_png))
-        self._exit.close()
-
-        self._exit_act = QAction(QtGui.QIcon(self._exit.name), "Exit", self)
+        self._exit_act = QAction("Exit", self)
         self._exit_act.setShortcut("Ctrl+Q")
         self._exit_act.setStatusTip("Exit application")
         self._exit_act.triggered.connect(qApp.closeAllWindows)
 
-        self._logo_ico = resources.logo_ico
-        self._icon = tempfile.NamedTemporaryFile(delete=False)
-        self._icon.write(base64.decodebytes(self._logo_ico))
-        self._icon.close()
-
-        self._selec_act = QAction(QtGui.QIcon(self._icon.name), "Select", self)
+        self._selec_act = QAction("Select", self)
         self._selec_act.setShortcut("Ctrl+E")
         self._selec_act.setStatusTip("Select Coins")
         self._selec_act.triggered.connect(self._coin)
 
-        self._about_ico = resources.about_png
-        self._about = tempfile.NamedTemporaryFile(delete=False)
-        self._about.write(base64.decodebytes(self._about_ico))
-        self._about.close()
-
-        self._about_act = QAction(QtGui.QIcon(self._about.name), "About", self)
+        self._about_act = QAction("About", self)
         self._about_act.setShortcut("Ctrl+Shift+A")
         self._about_act.setStatusTip("About")
         self._about_act.triggered.connect(self._show_about)
 
+        self._table_act = QAction("Table View", self)
+        self._table_act.setShortcut("Ctrl+T")
+        self._table_act.setStatusTip("Show the coins in a table view, which "
+                                     "scales to hundreds of coins")
+        self._table_act.setCheckable(True)
+        self._table_act.toggled.connect(self.main_widget.set_table_mode)
+
     def __layout(self):
         _widget = QWidget(self)
         _layout = QVBoxLayout(_widget)
@@ -239,9 +527,19 @@ class MainWindow(QtWidgets.QMainWindow):
         edit_menu = main_menu.addMenu("Edit")
         edit_menu.addAction(self._selec_act)
 
+        view_menu = main_menu.addMenu("View")
+        view_menu.addAction(self._table_act)
+
         about_menu = main_menu.addMenu("About")
         about_menu.addAction(self._about_act)
 
+        # Decode the menu icons the first time a menu is shown
+        self._menu_icons = {self._exit_act: "exit_png",
+                            self._selec_act: "logo_ico",
+                            self._about_act: "about_png"}
+        for menu in (file_menu, edit_menu, about_menu):
+            menu.aboutToShow.connect(self._load_menu_icons)
+
         tmp_width = 0
         for k, v in self.main_widget.coin_fields.items():
             tmp_width += int(v["width"])
@@ -252,19 +550,53 @@ class MainWindow(QtWidgets.QMainWindow):
         # Receive signal from main widget containing list of coin names to
         # populate check boxes
         self.main_widget.coin_names.connect(self.select_window.set_coin_names)
-        self.main_widget.coin_names.emit(self.main_widget.coins)
 
         # Receive signal from SelectCoin widget containing dict of selected
         # coins to populate MainWidget
         self.select_window.selected_coins_signal.connect(self.main_widget.dummy)
 
+        # Show failed polls in the status bar until a poll succeeds
+        self.main_widget.error.connect(self._show_error)
+        self.main_widget.alert.connect(self._show_alert)
+
+    def _show_error(self, error):
+        if error:
+            self.statusBar().showMessage(
+                "Update failed, retrying ({})".format(error))
+        else:
+            self.statusBar().clearMessage()
+
+    def _show_alert(self, texts):
+        # One desktop notification per change set through the tray icon
+        # where there is a tray, the status bar otherwise
+        if self._tray is None and QSystemTrayIcon.isSystemTrayAvailable():
+            self._tray = QSystemTrayIcon(icon("logo_ico"), self)
+            self._tray.show()
+        if self._tray is not None:
+            title = "CoinWatcher: {} alert{}".format(
+                len(texts), "s" if len(texts) > 1 else "")
+            body = "\n".join(texts[:5])
+            if len(texts) > 5:
+                body += "\n... and {} more".format(len(texts) - 5)
+            self._tray.showMessage(title, body)
+        else:
+            text = texts[0]
+            if len(texts) > 1:
+                text += " and {} more alerts".format(len(texts) - 1)
+            self.statusBar().showMessage(text, 30 * 1000)
+
+    def _load_menu_icons(self):
+        for action, name in self._menu_icons.items():
+            action.setIcon(icon(name))
+        self._menu_icons.clear()
+
     def _coin(self):
         # Display SelectCoin window
         self.select_window.show()
 
     def _show_about(self):
         self.about_window = AboutWidget(self)
-        self.about_window.setWindowIcon((QtGui.QIcon(self.logo.name)))
+        self.about_window.setWindowIcon(icon("logo_jpg"))
         self.about_window.show()
 
     def closeEvent(self, event):
@@ -273,15 +605,22 @@ class MainWindow(QtWidgets.QMainWindow):
         open does not crash program.
         """
         self.select_window.destroy()
+        self.main_widget.stop()
         event.accept()
-        os.remove(self.logo.name)
         qApp.quit()
 
 
 class MainWidget(QWidget):
+    """
+    Shows the selected coins. The ticker comes from source, which defaults to
+    a GetCoinData that also keeps the price history.
+    """
     coin_names = pyqtSignal(list)
+    coin_data_updated = pyqtSignal()
+    error = pyqtSignal(str)
+    alert = pyqtSignal(list)
 
-    def __init__(self, parent):
+    def __init__(self, parent, source=None):
         super(MainWidget, self).__init__(parent)
 
         # Container Widget
@@ -290,13 +629,24 @@ class MainWidget(QWidget):
 
         self.coins = []
         self.selected_coins = []
-        self.coin_data = []
         self.coin_boxes = []
         self.num_cols = []
 
+        # Latest snapshot, kept up to date from change sets, and a rank keyed
+        # view of it
+        self.coin_index = CoinIndex()
+        self.coin_data = self.coin_index.by_rank
+
+        # Show the coins in the table view instead of the grid of labels
+        self.table_mode = False
+
         self.font_size = 14
         self.row_height = self.font_size + 12  # 24
 
+        if source is None:
+            source = GetCoinData(history=HistoryStore(HISTORY_DIR))
+        self._worker_data = source
+
         self.coin_fields = {
             "name": {"text": "Name", "width": int(100 * self.font_size / 8)},
             "symbol": {"text": "Symbol", "width": int(50 * self.font_size / 8)},
@@ -305,25 +655,22 @@ class MainWidget(QWidget):
             "percent_change_24h": {"text": "24h Change",
                                    "width": int(85 * self.font_size / 8)}
             }
+        for currency in source.currencies:
+            self.coin_fields["price_" + currency.lower()] = {
+                "text": "Price " + currency,
+                "width": int(75 * self.font_size / 8)}
 
         self.__controls()
         self.__layout()
-
-        self._worker_name = GetCoinNames()
-        self._thread_name = QtCore.QThread()
-        self._worker_name.moveToThread(self._thread_name)
-        self._thread_name.started.connect(self._worker_name.start)
-
-        self._worker_data = GetCoinData()
         self._thread_data = QtCore.QThread()
         self._worker_data.moveToThread(self._thread_data)
         self._thread_data.started.connect(self._worker_data.start)
 
-        # Number of coins to retrieve
-        self.N = 0  # 0 = get all coins
+        # Number of coin names to offer for selection
+        self.N = 0  # 0 = all coins
 
         self.init_ui()
-        self.dummy(names={})
+        self.dummy([])
 
     def __controls(self):
         pass
@@ -344,9 +691,28 @@ class MainWidget(QWidget):
         self.scroll.setWidgetResizable(False)
         self.scroll.setWidget(self.grid_widget)
 
+        # Table view alternative to the grid
+        self.table_model = CoinTableModel(self.coin_fields, self.coin_index,
+                                          self)
+        self.table = QTableView()
+        self.table.setModel(self.table_model)
+        self.table.setShowGrid(False)
+        self.table.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOn)
+        self.table.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        self.table.verticalHeader().hide()
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(self.row_height)
+        font = self.table.font()
+        font.setPointSize(self.font_size)
+        self.table.setFont(font)
+        for j, field in enumerate(self.coin_fields):
+            self.table.setColumnWidth(j, self.coin_fields[field]["width"])
+        self.table.hide()
+
         # Scroll Area Layer add
         self.vLayout = QVBoxLayout()
         self.vLayout.addWidget(self.scroll)
+        self.vLayout.addWidget(self.table)
         self.vLayout.setContentsMargins(0, 0, 0, 0)
 
         tmp_width = 0
@@ -356,260 +722,319 @@ class MainWidget(QWidget):
         self.setLayout(self.vLayout)
 
     def init_ui(self):
-        self._worker_name.coin_names_signal.connect(self.get_coins)
-        self._worker_data.coin_data_signal.connect(self.update_coin_data)
+        self._worker_data.coin_names_signal.connect(self.get_coins)
+        self._worker_data.coin_delta_signal.connect(self.update_coin_data)
+        self._worker_data.error_signal.connect(self.error)
+        self._worker_data.alert_signal.connect(self.alert)
 
-        self._thread_name.start()
         self._thread_data.start()
         qApp.processEvents()
 
-        # Get N-number of coins worth of data
-        self._worker_name.get_coin_names(self.N)
+    def stop(self):
+        """
+        Stops polling. Pending polls are cancelled at once, and a fetch in
+        progress is interrupted, so the thread finishes before it is
+        destroyed. The worker quits the thread itself once its timers are
+        stopped, which has to happen in its own thread.
+        """
+        QtCore.QMetaObject.invokeMethod(self._worker_data, "stop",
+                                        QtCore.Qt.QueuedConnection)
+        self._worker_data.cancel()
+        self._thread_data.wait()
 
-    def clear_coin_boxes(self):
-        for i in reversed(range(self.grid.count())):
-            self.grid.itemAt(i).widget().setParent(None)
+    def add_coin_row(self, bold=False):
+        """
+        Appends a row of labels, one per coin field, to the grid and to
+        self.coin_boxes.
+        """
+        row = []
+        for j, field in enumerate(self.coin_fields):
+            label = QLabel(self)
+            label.setFixedWidth(self.coin_fields[field]["width"])
+            label.setFixedHeight(self.font_size * 2)
 
-    def update_coin_boxes(self):
-        self.clear_coin_boxes()
+            font = label.font()
+            font.setPointSize(self.font_size)
+            font.setBold(bold)
+            label.setFont(font)
+
+            self.grid.addWidget(label, len(self.coin_boxes), j)
+            row.append(label)
+        self.coin_boxes.append(row)
 
-        # Create text boxes
+    def remove_coin_row(self):
+        for label in self.coin_boxes.pop():
+            self.grid.removeWidget(label)
+            label.deleteLater()
+
+    def update_coin_boxes(self):
+        """
+        Shows the selected coins in the grid. The labels are kept between
+        updates: rows are only added or removed when the number of selected
+        coins changes, and a label's text is only set when it changed.
+        """
         # TODO: Add menu item to select which data to show and then set the number of cols to tha number of fields selected
         self.num_cols = self.coin_fields
 
-        tmp_cnt = 0
-        for i, field in enumerate(self.coin_fields):
-            self.coin_boxes.append(QLabel(self))
-            self.coin_boxes[tmp_cnt].setText(self.coin_fields[field]["text"])
-
-            self.coin_boxes[tmp_cnt].setFixedWidth(
-                self.coin_fields[field]["width"])
+        if not self.coin_boxes:
+            self.add_coin_row(bold=True)
+            for label, field in zip(self.coin_boxes[0], self.coin_fields):
+                label.setText(self.coin_fields[field]["text"])
 
-            self.coin_boxes[tmp_cnt].setFixedHeight(self.font_size * 2)
+        coins = self.sorted_selection()
+        while len(self.coin_boxes) <= len(coins):
+            self.add_coin_row()
+        while len(self.coin_boxes) > len(coins) + 1:
+            self.remove_coin_row()
 
-            self.grid.addWidget(self.coin_boxes[tmp_cnt], 0, i)
-            font = self.coin_boxes[tmp_cnt].font()
-            font.setPointSize(self.font_size)
-            font.setBold(True)
-            self.coin_boxes[tmp_cnt].setFont(font)
-            tmp_cnt += 1
+        for row, coin_id in zip(self.coin_boxes[1:], coins):
+            coin = self.coin_index.get(coin_id)
 
-        tmp_color = "black"
-        for idx, coin_idx in enumerate(sorted(self.selected_coins)):
-            if float(self.coin_data[coin_idx]["percent_change_24h"]) > 0:
+            tmp_color = "black"
+            change = coin["percent_change_24h"] or 0
+            if change > 0:
                 tmp_color = "green"
-            elif float(self.coin_data[coin_idx]["percent_change_24h"]) < 0:
+            elif change < 0:
                 tmp_color = "red"
 
-            for j, field in enumerate(self.coin_fields):
-                self.coin_boxes.append(QLabel(self))
-
-                self.coin_boxes[tmp_cnt].setText(
-                    "<font color={}>{:s}</font>".format(
-                        tmp_color, self.coin_data[coin_idx][field]))
-
-                self.coin_boxes[tmp_cnt].setFixedWidth(
-                    self.coin_fields[field]["width"])
-
-                self.coin_boxes[tmp_cnt].setFixedHeight(self.font_size * 2)
-
-                font = self.coin_boxes[tmp_cnt].font()
-                font.setPointSize(self.font_size)
-                self.coin_boxes[tmp_cnt].setFont(font)
-                self.grid.addWidget(self.coin_boxes[tmp_cnt], idx + 1, j)
-
-                tmp_cnt += 1
+            for label, field in zip(row, self.coin_fields):
+                text = "<font color={}>{:s}</font>".format(
+                    tmp_color, format_value(coin[field]))
+                if label.text() != text:
+                    label.setText(text)
 
         tmp_width = 0
         for k, v in self.coin_fields.items():
             tmp_width += int(v["width"])
 
         self.grid_widget.setGeometry(0, 0, tmp_width,
-                                     (len(self.selected_coins) + 1) *
-                                     self.row_height + 10)
+                                     (len(coins) + 1) * self.row_height + 10)
+
+    def sorted_selection(self):
+        """Returns the ids of the listed selected coins ordered by rank."""
+        return sorted((i for i in self.selected_coins if i in self.coin_index),
+                      key=self.coin_index.rank)
 
     def get_names(self):
         pass
 
     @QtCore.pyqtSlot(list, name="getCoins")
     def get_coins(self, names):
-        self.coins = names
+        self.coins = names[:self.N] if self.N else names
+        self.coin_names.emit(self.coins)
 
-    @QtCore.pyqtSlot(dict, name="dummy")
-    def dummy(self, names):
+    @QtCore.pyqtSlot(list, name="dummy")
+    def dummy(self, ids):
+        """
+        Function takes in a list of the ids of the selected coins, which stay
+        the same when the market cap ranking changes
         """
-        Function takes in a dictionary of coin names that use their market cap
-        ranking as an index
+        self.selected_coins = ids
+        if self.table_mode:
+            self.table_model.set_coins(ids)
+        else:
+            self.update_coin_boxes()
+
+    @QtCore.pyqtSlot(bool, name="setTableMode")
+    def set_table_mode(self, enabled):
         """
-        self.selected_coins = names
-        self.update_coin_boxes()
+        Switches between the grid of labels and the table view. The labels
+        of the grid are released while the table is shown.
+        """
+        self.table_mode = enabled
+        self.scroll.setVisible(not enabled)
+        self.table.setVisible(enabled)
+
+        if enabled:
+            while self.coin_boxes:
+                self.remove_coin_row()
+            self.table_model.set_coins(self.selected_coins)
+        else:
+            self.table_model.set_coins([])
+            self.update_coin_boxes()
 
     @QtCore.pyqtSlot(dict, name="updateCoinData")
-    def update_coin_data(self, coin_data):
-        self.coin_data = coin_data
-        self.update_coin_boxes()
+    def update_coin_data(self, delta):
+        """
+        Applies a change set from GetCoinData and only redraws the coin boxes
+        if a selected coin was affected. In table mode only the rows of the
+        affected coins are updated, unless the order of the rows changed.
+        """
+        self.coin_index.apply(delta)
+
+        selected = set(self.selected_coins)
+        moved = {i for i in selected if i in delta["added"] or
+                 i in delta["removed"] or i in delta["reranked"]}
+        changed = selected.intersection(delta["changed"])
+
+        if self.table_mode:
+            if moved:
+                self.table_model.set_coins(self.selected_coins)
+            elif changed:
+                self.table_model.update_coins(changed)
+        elif moved or changed:
+            self.update_coin_boxes()
+
+        self.coin_data_updated.emit()
+
+
+class CoinListModel(QtCore.QAbstractListModel):
+    """
+    Checkable list model over the coin ids ordered by rank, with an optional
+    filter. The filter searches the prefix trie of coin_index if one is given
+    and falls back to substring matching on the ids otherwise. The checked
+    coins are kept in a set of ids, so the selection does not depend on which
+    rows exist or are visible, nor on the ranking.
+    """
+    selection_changed = pyqtSignal()
+
+    def __init__(self, coin_index=None, parent=None):
+        super(CoinListModel, self).__init__(parent)
+        self.coin_index = coin_index
+        self.selected = set()
+
+        self._names = []
+        self._lower = []
+        # Index into self._names of each coin id
+        self._position = dict()
+        # Indexes into self._names of the rows that match the filter
+        self._rows = []
+        self._filter = ""
+
+    def set_names(self, names):
+        """
+        Replaces the coin names. Selected coins that are no longer listed are
+        dropped from the selection without emitting selection_changed.
+        """
+        self.beginResetModel()
+        self._names = list(names)
+        self._lower = [name.lower() for name in self._names]
+        self._position = {name: i for i, name in enumerate(self._names)}
+        self._rows = self._match(range(len(self._names)), self._filter)
+        self.endResetModel()
+
+        self.selected.intersection_update(self._names)
+
+    def set_filter(self, text):
+        """
+        Shows only the coins that match text. Without a coin index, extending
+        the previous filter only rescans the rows that matched it.
+        """
+        text = text.strip().lower()
+        if text.startswith(self._filter):
+            candidates = self._rows
+        else:
+            candidates = range(len(self._names))
+
+        self.beginResetModel()
+        self._rows = self._match(candidates, text)
+        self._filter = text
+        self.endResetModel()
+
+    def _match(self, candidates, text):
+        if not text:
+            return list(candidates)
+        if self.coin_index is not None:
+            return sorted(self._position[i] for i in
+                          self.coin_index.prefix(text) if i in self._position)
+        return [i for i in candidates if text in self._lower[i]]
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        i = self._rows[index.row()]
+
+        if role == QtCore.Qt.DisplayRole:
+            return "{}: {:s}".format(i + 1, self._names[i])
+        if role == QtCore.Qt.CheckStateRole:
+            return (QtCore.Qt.Checked if self._names[i] in self.selected
+                    else QtCore.Qt.Unchecked)
+        return None
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if not index.isValid() or role != QtCore.Qt.CheckStateRole:
+            return False
+        name = self._names[self._rows[index.row()]]
+
+        if value == QtCore.Qt.Checked:
+            self.selected.add(name)
+        else:
+            self.selected.discard(name)
+
+        self.dataChanged.emit(index, index, [role])
+        self.selection_changed.emit()
+        return True
+
+    def flags(self, index):
+        return (QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable |
+                QtCore.Qt.ItemIsUserCheckable)
 
 
 class SelectCoins(QtWidgets.QWidget):
     """
     GUI window that presents a list of coins for the user to select and returns
-    the selected coin names to the main GUI.
+    the ids of the selected coins to the main GUI. The list only creates the
+    rows it paints, so it opens instantly with thousands of coins.
     """
-    selected_coins_signal = pyqtSignal(dict)
+    selected_coins_signal = pyqtSignal(list)
 
-    def __init__(self, parent):
+    def __init__(self, parent, coin_index=None):
         super(SelectCoins, self).__init__()
 
-        # Container Widget
-        self.widget = QWidget()
-        self.grid_widget = QWidget()
+        self.model = CoinListModel(coin_index, self)
+        self.model.selection_changed.connect(self.selected)
 
         self.__controls()
         self.__layout()
 
-        self.coins = []
         self.coin_names = []
-        self.selected_coins = dict()
+        self.selected_coins = []
 
-        self.num_cols = 4
         self.col_width = 150
         self.row_height = 24
-        self.setGeometry(200, 100, self.num_cols * self.col_width,
-                         self.row_height * 10)
+        self.setGeometry(200, 100, 4 * self.col_width, self.row_height * 10)
 
     def __controls(self):
-        self.label_num_coins = QLabel("Number of Coins")
-        self.label_num_coins.setFixedWidth(100)
-        self.edit_num_coins = QLineEdit()
-        self.edit_num_coins.setText("10")
-        self.edit_num_coins.setFixedWidth(50)
-        self.edit_num_coins.textChanged.connect(self.update_grid)
-
-        self.label_coin_index = QLabel("Start Index")
-        self.label_coin_index.setFixedWidth(100)
-        self.edit_coin_index = QLineEdit()
-        self.edit_coin_index.setText("1")
-        self.edit_coin_index.setFixedWidth(50)
-        self.edit_coin_index.textChanged.connect(self.update_grid)
+        self.label_filter = QLabel("Filter")
+        self.label_filter.setFixedWidth(100)
+        self.edit_filter = QLineEdit()
+        self.edit_filter.setClearButtonEnabled(True)
+        self.edit_filter.textChanged.connect(self.model.set_filter)
+
+        self.coin_list = QListView()
+        self.coin_list.setModel(self.model)
+        self.coin_list.setUniformItemSizes(True)
 
     def __layout(self):
-        self.layout = QVBoxLayout()
-        self.vbox = QVBoxLayout()
         self.hbox = QHBoxLayout()
-        self.hbox2 = QHBoxLayout()
-        self.grid = QGridLayout()
-
-        self.hbox.addWidget(self.label_num_coins, alignment=QtCore.Qt.AlignLeft)
-        self.hbox.addWidget(self.edit_num_coins, alignment=QtCore.Qt.AlignLeft)
-
-        self.hbox.addWidget(self.label_coin_index,
-                            alignment=QtCore.Qt.AlignLeft)
-        self.hbox.addWidget(self.edit_coin_index,
-                            alignment=QtCore.Qt.AlignLeft)
-
-        self.vbox.addLayout(self.hbox)
-
-        self.widget.setLayout(self.vbox)
-        self.grid_widget.setLayout(self.grid)
+        self.hbox.addWidget(self.label_filter, alignment=QtCore.Qt.AlignLeft)
+        self.hbox.addWidget(self.edit_filter)
 
-        # Scroll Area Properties
-        self.scroll = QScrollArea()
-
-        self.scroll.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOn)
-        self.scroll.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
-        self.scroll.setWidgetResizable(False)
-        self.scroll.setWidget(self.grid_widget)
-
-        # Scroll Area Layer add
         self.vLayout = QVBoxLayout()
-        self.vLayout.addWidget(self.widget)
-        self.vLayout.addWidget(self.scroll)
+        self.vLayout.addLayout(self.hbox)
+        self.vLayout.addWidget(self.coin_list)
 
         self.setLayout(self.vLayout)
 
-    def initialize_grid(self):
-        row_cnt = 0
-        for i in range(len(self.coin_names)):
-
-            if i % self.num_cols == 0:
-                row_cnt += 1
-
-            self.coins.append(QCheckBox(self))
-            self.coins[i].setText("{}: {:s}".format(i + 1,
-                                                    self.coin_names[i]))
-            self.coins[i].setObjectName("{}".format(self.coin_names[i]))
-
-            self.coins[i].stateChanged.connect(self.selected)
-            self.coins[i].setFixedWidth(self.col_width)
-
-            self.grid.addWidget(self.coins[i], row_cnt, i % self.num_cols,
-                                alignment=QtCore.Qt.AlignLeft)
-
-    def clear_grid(self):
-        for i in reversed(range(self.grid.count())):
-            self.grid.itemAt(i).widget().setParent(None)
-
-    def update_grid(self):
-        self.clear_grid()
-
-        start_idx = int(self.edit_coin_index.text())
-        num_coins_to_show = int(self.edit_num_coins.text())
-        num_coins_total = len(self.coin_names)
-
-        if (not self.edit_num_coins.text() in ["", "0"]
-                and not self.edit_coin_index.text() in ["", "0"]):
-
-            if num_coins_to_show > num_coins_total - start_idx:
-                num_coins_to_show = num_coins_total - (start_idx - 1)
-
-            row_cnt = 0
-            if not self.coins:
-                self.initialize_grid()
-                self.update_grid()
-
-            else:
-                i = 0
-                for i in range(num_coins_to_show):
-
-                    if i % self.num_cols == 0:
-                        row_cnt += 1
-
-                    self.grid.addWidget(self.coins[i + start_idx - 1], row_cnt,
-                                        i % self.num_cols,
-                                        alignment=QtCore.Qt.AlignLeft)
-
-                if not (i + 1) % self.num_cols == 0:
-                    blank = QLabel("")
-                    blank.setFixedWidth(self.col_width)
-                    self.grid.addWidget(blank, row_cnt,
-                                        i % self.num_cols + 1, 1,
-                                        self.num_cols - (
-                                                (i + 1) % self.num_cols))
-
-                self.grid_widget.setGeometry(0, 0,
-                                             self.num_cols * self.col_width,
-                                             row_cnt * self.row_height + 10)
-
     @QtCore.pyqtSlot(list, name="setCoinNames")
     def set_coin_names(self, names):
-        self.coin_names = names
-        self.initialize_grid()
-        self.update_grid()
-
-    def selected(self, state):
         """
-        When a coin checkbox is checked this function adds the coin index and
-        name to the dictionary or removes the coin if unselected.
+        Updates the list for a new list of coin ids ordered by rank. Selected
+        coins stay checked, and the selection is only emitted again if some of
+        them are no longer listed.
         """
-        idx, name = self.sender().text().split(":")
-        idx = int(idx)
+        self.coin_names = names
+        self.model.set_names(names)
 
-        if state == QtCore.Qt.Checked:
-            self.selected_coins[idx] = name
-        elif state == QtCore.Qt.Unchecked:
-            del self.selected_coins[idx]
+        if len(self.model.selected) != len(self.selected_coins):
+            self.selected()
 
-        # Emit currently selected coins to MainWindow
+    def selected(self):
+        """Emits the ids of the selected coins to MainWindow."""
+        self.selected_coins = sorted(self.model.selected)
         self.selected_coins_signal.emit(self.selected_coins)
 
 
@@ -623,7 +1048,6 @@ class AboutWidget(QtWidgets.QWidget):
         self.setWindowTitle("Ryan's CoinWatcher")
 
         self.setWindowTitle("About")
-        # self.setWindowIcon(QtGui.QIcon(self.logo.name))
 
         self.__controls()
         self.__layout()
@@ -631,12 +1055,7 @@ class AboutWidget(QtWidgets.QWidget):
     def __controls(self):
         self.label_about = QLabel(self)
 
-        self._splash_png = resources.splash_png
-        self._splash = tempfile.NamedTemporaryFile(delete=False)
-        self._splash.write(base64.decodebytes(self._splash_png))
-        self._splash.close()
-
-        _splash = QtGui.QPixmap(self._splash.name)
+        _splash = pixmap("splash_png")
         self.label_about.setPixmap(_splash)
         self.resize(_splash.width(), _splash.height())
 
@@ -648,8 +1067,81 @@ class AboutWidget(QtWidgets.QWidget):
 
 
 def main():
-    app = QtWidgets.QApplication(sys.argv)
-    win = MainWindow()
+    parser = argparse.ArgumentParser(description="Ryan's CoinWatcher")
+    parser.add_argument("--record",
+                        help="append every ticker snapshot to this file")
+    parser.add_argument("--replay",
+                        help="replay the snapshots of a file written with "
+                             "--record instead of polling the ticker")
+    parser.add_argument("--rate", type=float, default=100,
+                        help="replayed snapshots per second")
+    parser.add_argument("--frames", type=int, default=0,
+                        help="number of snapshots to replay, by default "
+                             "the file is replayed once")
+    parser.add_argument("--currency", action="append", default=[],
+                        help="add a price column in this currency, e.g. "
+                             "EUR, can be given several times")
+    parser.add_argument("--fx-url",
+                        help="exchange rate API URL for --currency, by "
+                             "default open.er-api.com")
+    parser.add_argument("--alert", action="append", default=[],
+                        type=parse_rule, metavar="RULE",
+                        help="notify when a rule such as 'bitcoin price_usd "
+                             "> 70000' fires, can be given several times")
+    parser.add_argument("--alerts", metavar="FILE",
+                        help="read alert rules from this file, one per line")
+    parser.add_argument("--select", type=int, default=0,
+                        help="select the given number of top ranked coins")
+    parser.add_argument("--table", action="store_true",
+                        help="start in the table view")
+    parser.add_argument("--headless", action="store_true",
+                        help="run without a display, e.g. to profile a "
+                             "replay")
+    args, qt_args = parser.parse_known_args()
+
+    if args.headless:
+        os.environ["QT_QPA_PLATFORM"] = "offscreen"
+    app = QtWidgets.QApplication(sys.argv[:1] + qt_args)
+
+    alerts = None
+    if args.alert or args.alerts:
+        alerts = AlertEngine(args.alert)
+        if args.alerts:
+            with open(args.alerts) as f:
+                for rule in read_rules(f):
+                    alerts.add(rule)
+
+    fx = None
+    if args.currency and args.fx_url:
+        fx = FxRates(args.fx_url)
+
+    if args.replay:
+        source = ReplayCoinData(args.replay, args.rate, args.frames,
+                                alerts=alerts)
+    else:
+        source = GetCoinData(history=HistoryStore(HISTORY_DIR),
+                             record=args.record, currencies=args.currency,
+                             fx=fx, alerts=alerts)
+    win = MainWindow(source=source)
+
+    if args.select:
+        def select(names):
+            win.main_widget.coin_names.disconnect(select)
+            win.select_window.model.selected.update(names[:args.select])
+            win.select_window.selected()
+        win.main_widget.coin_names.connect(select)
+    if args.table:
+        win._table_act.setChecked(True)
+
+    if args.replay:
+        def finished(stats):
+            print(json.dumps(stats, indent=2))
+            # Closing stops the worker thread before the application quits
+            win.close()
+        win.main_widget.coin_data_updated.connect(source.frame_done,
+                                                  QtCore.Qt.DirectConnection)
+        source.finished.connect(finished)
+
     win.show()
     app.exec_()
 
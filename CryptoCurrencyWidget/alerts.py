@@ -0,0 +1,170 @@
+"""
+Price alerts on the change sets of the ticker that do not depend on Qt.
+
+A rule watches one field of one coin, or of every coin with the id *, and
+fires when the field's value crosses a threshold or changes at all:
+
+    bitcoin price_usd > 70000       price rose above 70000
+    ethereum percent_change_24h < -10
+    * rank change                   any coin moved in the ranking
+
+Rules are indexed by coin and field, and the thresholds of each field are
+kept sorted, so a change set only looks at the fields that changed and finds
+the crossed thresholds by bisection. The cost of an evaluation therefore
+depends on the size of the change set and the number of alerts that fire,
+not on the number of rules. The first value seen of a field is its baseline
+and does not fire, also when a coin that was removed from the ticker comes
+back.
+"""
+import bisect
+import collections
+
+OPERATORS = (">", "<", "change")
+
+_MISSING = object()
+
+Rule = collections.namedtuple("Rule", "coin_id field op threshold")
+
+Alert = collections.namedtuple("Alert", "rule coin_id old new")
+
+
+def parse_rule(text):
+    """
+    Parses a rule written as "<coin id> <field> > <number>", with < for a
+    falling value, or "<coin id> <field> change". Raises ValueError if the
+    text is not a rule.
+    """
+    parts = text.split()
+    if len(parts) == 3 and parts[2] == "change":
+        return Rule(parts[0], parts[1], "change", None)
+    if len(parts) != 4 or parts[2] not in OPERATORS[:2]:
+        raise ValueError("Not an alert rule: {!r}".format(text))
+    return Rule(parts[0], parts[1], parts[2], float(parts[3]))
+
+
+def read_rules(f):
+    """Parses one rule per line of a file, skipping blanks and # comments."""
+    return [parse_rule(line) for line in
+            (line.split("#", 1)[0].strip() for line in f) if line]
+
+
+def format_alert(alert):
+    """Returns the text of a notification for an alert."""
+    rule = alert.rule
+    if rule.op == "change":
+        return "{} {} changed from {} to {}".format(
+            alert.coin_id, rule.field, alert.old, alert.new)
+    return "{} {} {} {:g} ({})".format(
+        alert.coin_id, rule.field,
+        "rose above" if rule.op == ">" else "fell below",
+        rule.threshold, alert.new)
+
+
+class _Thresholds(object):
+    """The rules of one coin field, with the thresholds of > and < sorted."""
+    __slots__ = ("above", "above_rules", "below", "below_rules", "change")
+
+    def __init__(self):
+        self.above = []
+        self.above_rules = []
+        self.below = []
+        self.below_rules = []
+        self.change = []
+
+    def add(self, rule):
+        if rule.op == "change":
+            self.change.append(rule)
+            return
+        keys, rules = ((self.above, self.above_rules) if rule.op == ">" else
+                       (self.below, self.below_rules))
+        i = bisect.bisect_right(keys, rule.threshold)
+        keys.insert(i, rule.threshold)
+        rules.insert(i, rule)
+
+    def crossed(self, old, new):
+        """Returns the rules that fire when the value moves from old to
+        new."""
+        fired = list(self.change)
+        if old is None or new is None:
+            return fired
+        if new > old:
+            # Thresholds t with old <= t < new
+            fired.extend(self.above_rules[
+                bisect.bisect_left(self.above, old):
+                bisect.bisect_left(self.above, new)])
+        elif new < old:
+            # Thresholds t with new < t <= old
+            fired.extend(self.below_rules[
+                bisect.bisect_right(self.below, new):
+                bisect.bisect_right(self.below, old)])
+        return fired
+
+
+class AlertEngine(object):
+    """
+    Evaluates alert rules against the change sets returned by ticker.diff().
+    The alerts that fire on a change set are passed to the notify callbacks
+    together as one list, so they can be shown as one notification.
+    """
+
+    def __init__(self, rules=(), notify=()):
+        self.notify = list(notify)
+        self._rules = dict()     # {coin id: {field: _Thresholds}}
+        self._values = dict()    # {coin id: {field: last value}}
+        self._count = 0
+        for rule in rules:
+            self.add(rule)
+
+    def __len__(self):
+        return self._count
+
+    def add(self, rule):
+        """Adds a rule, given as a Rule or as text for parse_rule()."""
+        if isinstance(rule, str):
+            rule = parse_rule(rule)
+        fields = self._rules.setdefault(rule.coin_id, dict())
+        fields.setdefault(rule.field, _Thresholds()).add(rule)
+        self._count += 1
+
+    def evaluate(self, delta):
+        """
+        Updates the watched values from a change set and returns the alerts
+        that fired, after passing them to the notify callbacks.
+        """
+        for coin_id in delta["removed"]:
+            self._values.pop(coin_id, None)
+
+        alerts = []
+        for coin_id, coin in delta["added"].items():
+            self._check(coin_id, coin, alerts)
+        for coin_id, fields in delta["changed"].items():
+            self._check(coin_id, fields, alerts)
+        for coin_id, ranks in delta["reranked"].items():
+            self._check(coin_id, {"rank": ranks[1]}, alerts)
+
+        if alerts:
+            for callback in self.notify:
+                callback(alerts)
+        return alerts
+
+    def _check(self, coin_id, fields, alerts):
+        watched = collections.defaultdict(list)
+        for rules in (self._rules.get(coin_id), self._rules.get("*")):
+            if rules:
+                for field, thresholds in rules.items():
+                    if field in fields:
+                        watched[field].append(thresholds)
+
+        if not watched:
+            return
+        values = self._values.setdefault(coin_id, dict())
+        for field, groups in watched.items():
+            new = fields[field]
+            old = values.get(field, _MISSING)
+            values[field] = new
+            # The first value of a field is its baseline
+            if old is _MISSING or old == new:
+                continue
+            for thresholds in groups:
+                alerts.extend(Alert(rule, coin_id, old, new)
+                              for rule in thresholds.crossed(old, new))
@@ -0,0 +1,98 @@
+"""
+Conversion of the ticker's USD prices into other currencies.
+
+The ticker can convert prices itself with ?convert=EUR, but only into one
+currency per request, so N currencies would cost N downloads of the full
+ticker. Instead the exchange rates of all currencies are fetched in one small
+request once per interval and the currency columns are derived locally from
+the USD prices of each snapshot.
+
+The rates come from the free API of open.er-api.com (ExchangeRate-API) by
+default, a third party service with its own terms of use and rate limits.
+Any API that returns the same {"rates": {currency: rate}} layout can be used
+instead, see --fx-url.
+"""
+import time
+
+import numpy as np
+
+from ticker import TickerClient
+
+FX_URL = "https://open.er-api.com/v6/latest/USD"
+
+
+def round_significant(values, digits=8):
+    """Rounds an array to the given number of significant digits."""
+    values = np.asarray(values, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        magnitude = np.floor(np.log10(np.abs(values)))
+    magnitude[~np.isfinite(magnitude)] = 0
+    scale = 10.0 ** (digits - 1 - magnitude)
+    return np.round(values * scale) / scale
+
+
+class FxRates(object):
+    """
+    Exchange rates from USD to other currencies, fetched from an API that
+    returns {"rates": {currency: rate}} for all currencies at once and cached
+    for interval seconds.
+    """
+
+    def __init__(self, url=FX_URL, interval=60 * 60, client=None):
+        self.interval = interval
+        self.rates = {"USD": 1.0}
+        self.updated = None
+        self._client = client if client is not None else TickerClient(url)
+
+    def refresh(self, force=False):
+        """
+        Fetches the rates if they are older than interval or force is set.
+        Returns whether the rates changed.
+        """
+        if (not force and self.updated is not None and
+                time.monotonic() - self.updated < self.interval):
+            return False
+
+        data = self._client.get(commit=False)
+        self.updated = time.monotonic()
+        if data is None:
+            return False
+        if data.get("result", "success") != "success":
+            raise ValueError("Exchange rates not available: {}".format(
+                data.get("error-type", data["result"])))
+
+        rates = {currency.upper(): float(rate)
+                 for currency, rate in data["rates"].items()}
+        rates["USD"] = 1.0
+        self._client.commit()
+        changed = rates != self.rates
+        self.rates = rates
+        return changed
+
+    def close(self):
+        """Closes the connection to the API, see TickerClient.close()."""
+        self._client.close()
+
+    def convert(self, usd, currencies):
+        """
+        Converts an array of USD amounts into an array with one column per
+        currency. Amounts in currencies without a rate are NaN.
+        """
+        rates = np.array([self.rates.get(currency.upper(), np.nan)
+                          for currency in currencies])
+        return round_significant(np.outer(usd, rates))
+
+    def add_prices(self, coins, currencies, field="price_usd"):
+        """
+        Sets price_<currency> of every coin, for example price_eur, to its
+        USD price converted with the cached rates. Prices that can not be
+        converted are set to None.
+        """
+        usd = np.fromiter((np.nan if coin[field] is None else coin[field]
+                           for coin in coins), float, len(coins))
+        table = self.convert(usd, currencies)
+
+        names = ["price_" + currency.lower() for currency in currencies]
+        for coin, row in zip(coins, table.tolist()):
+            for name, price in zip(names, row):
+                coin[name] = None if price != price else price
@@ -0,0 +1,141 @@
+"""
+Polls the CoinMarketCap ticker without a GUI.
+
+Every snapshot that changed is written as one JSON list per line, the format
+CryptoCurrencyUpdater.py reads with --replay, or as the change set against
+the previous snapshot, and can be appended to the price history store. PyQt5
+is not imported, and NumPy only when the history store or currency
+conversion is used, so this starts quickly and runs on servers:
+
+    python headless.py --interval 60 --history >> ticker.jsonl
+"""
+import argparse
+import json
+import signal
+import sys
+import threading
+
+from alerts import AlertEngine, format_alert, parse_rule, read_rules
+from ticker import ROOT_URL, Backoff, SnapshotPipeline, TickerClient, \
+    write_snapshot
+
+
+def write_changes(f, delta):
+    """Writes a change set returned by ticker.diff() as one line of JSON."""
+    f.write(json.dumps(delta, default=lambda coin: coin.to_dict()) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--interval", type=float, default=5 * 60,
+                        help="seconds between polls")
+    parser.add_argument("--limit", type=int, default=0,
+                        help="number of top ranked coins, 0 for all")
+    parser.add_argument("--once", action="store_true",
+                        help="poll once and exit")
+    parser.add_argument("--changes", action="store_true",
+                        help="write the change sets instead of snapshots")
+    parser.add_argument("--output",
+                        help="append to this file instead of writing to "
+                             "stdout, '' to write nothing")
+    parser.add_argument("--history", nargs="?", const="",
+                        help="append the snapshots to the history store in "
+                             "this directory, by default "
+                             "~/.coinwatcher/history")
+    parser.add_argument("--currency", action="append", default=[],
+                        help="add the price in this currency, e.g. EUR, as "
+                             "price_eur, can be given several times")
+    parser.add_argument("--alert", action="append", default=[],
+                        type=parse_rule, metavar="RULE",
+                        help="print to stderr when a rule such as 'bitcoin "
+                             "price_usd > 70000' fires, can be given several "
+                             "times")
+    parser.add_argument("--alerts", metavar="FILE",
+                        help="read alert rules from this file, one per line")
+    parser.add_argument("--url", default=ROOT_URL, help="ticker API URL")
+    parser.add_argument("--fx-url", help="exchange rate API URL, by default "
+                                         "open.er-api.com")
+    args = parser.parse_args(argv)
+
+    fx = None
+    if args.currency:
+        from currency import FX_URL, FxRates
+        fx = FxRates(args.fx_url or FX_URL)
+
+    alerts = None
+    if args.alert or args.alerts:
+        alerts = AlertEngine(args.alert, notify=[lambda fired: print(
+            "".join("Alert: {}\n".format(format_alert(alert))
+                    for alert in fired), end="", file=sys.stderr, flush=True)])
+        if args.alerts:
+            with open(args.alerts) as f:
+                for rule in read_rules(f):
+                    alerts.add(rule)
+
+    history = None
+    if args.history is not None:
+        from history import HISTORY_DIR, HistoryStore
+        history = HistoryStore(args.history or HISTORY_DIR)
+
+    if args.output is None:
+        output = sys.stdout
+    elif args.output:
+        output = open(args.output, "a")
+    else:
+        output = None
+
+    # Stop between polls on SIGTERM as well as on Ctrl+C
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+
+    client = TickerClient(args.url)
+    backoff = Backoff(args.interval)
+    pipeline = SnapshotPipeline(args.currency, fx, alerts, history)
+    query = "?limit={}".format(args.limit)
+    failed = False
+    try:
+        while not stopped.is_set():
+            try:
+                data = client.get_coins(query, commit=False)
+                failed = False
+            except Exception as e:
+                failed = True
+                print("Update failed: {}: {}".format(type(e).__name__, e),
+                      file=sys.stderr)
+                data = None
+
+            if fx is not None:
+                # Keep converting with the last rates while the API is down
+                try:
+                    fx.refresh()
+                except Exception as e:
+                    print("Exchange rate update failed: {}: {}".format(
+                        type(e).__name__, e), file=sys.stderr)
+
+            if data is not None:
+                delta = pipeline.update(data)
+                if output is not None:
+                    if not args.changes:
+                        write_snapshot(output, data)
+                    elif any(delta.values()):
+                        write_changes(output, delta)
+                    output.flush()
+                client.commit(query)
+                for error in pipeline.store(data):
+                    print("Write failed: " + error, file=sys.stderr)
+
+            if args.once:
+                break
+            stopped.wait(backoff.delay(failed))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+        if output not in (None, sys.stdout):
+            output.close()
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
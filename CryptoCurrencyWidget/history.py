@@ -0,0 +1,191 @@
+"""
+Append-only price history for the ticker that does not depend on Qt.
+
+Every coin gets one segment file per month, root/YYYY-MM/<coin id>, holding
+fixed width records of the time of the ticker update followed by one float
+per field. Segments are only ever appended to and are read back through a
+memory map, so a range query for one coin touches only that coin's segments
+and returns its columns as views without parsing. A record is only written
+when the coin's last_updated time advanced, which bounds the size of the store
+by the update rate of the ticker rather than by the polling rate. Segments
+older than the retention period are removed a whole month at a time.
+"""
+import datetime
+import os
+import shutil
+import urllib.parse
+
+import numpy as np
+
+HISTORY_DIR = os.path.join(os.path.expanduser("~"), ".coinwatcher", "history")
+
+FIELDS = ("price_usd", "price_btc", "24h_volume_usd", "market_cap_usd",
+          "percent_change_1h", "percent_change_24h", "percent_change_7d")
+
+
+def record_dtype(fields=FIELDS):
+    """Record layout of a segment: the time in seconds and one float per
+    field, with the USD price in double and the other fields in single
+    precision."""
+
+    return np.dtype([("time", "<u4")] +
+                    [(field, "<f8" if field == "price_usd" else "<f4")
+                     for field in fields])
+
+
+class HistoryStore(object):
+    """
+    Per coin price history stored under root. Snapshots are added with
+    append() and read back for one coin with query().
+    """
+
+    def __init__(self, root, fields=FIELDS, retention_days=366):
+        self.root = root
+        self.fields = tuple(fields)
+        self.dtype = record_dtype(self.fields)
+        self.retention_days = retention_days
+
+        # Time of the last record of each coin in the current segment
+        self._last = dict()
+        self._month = None
+
+    def append(self, coins):
+        """
+        Appends a record for every coin of a ticker snapshot, given as an
+        iterable of coin dicts, whose last_updated time advanced since its
+        previous record. Returns the number of records written.
+        """
+        written = 0
+        for coin in coins:
+            if not coin.get("last_updated"):
+                continue
+            t = int(coin["last_updated"])
+
+            month = self._segment(t)
+            if month != self._month:
+                self._month = month
+                self._last = dict()
+                os.makedirs(os.path.join(self.root, month), exist_ok=True)
+                self.prune(t)
+
+            coin_id = coin["id"]
+            if coin_id not in self._last:
+                self._last[coin_id] = self._last_time(month, coin_id)
+            if t <= self._last[coin_id]:
+                continue
+
+            record = np.array([(t,) + tuple(
+                float(coin[field]) if coin.get(field) is not None else np.nan
+                for field in self.fields)], self.dtype)
+
+            with open(self._path(month, coin_id), "ab") as f:
+                f.write(record.tobytes())
+            self._last[coin_id] = t
+            written += 1
+        return written
+
+    def query(self, coin_id, start=None, end=None):
+        """
+        Returns the records of a coin with start <= time < end as a structured
+        array, whose fields are the time and the stored ticker fields. Either
+        bound can be None for an open range.
+        """
+        parts = []
+        for month in self.months():
+            if start is not None and month < self._segment(start):
+                continue
+            if end is not None and month > self._segment(end):
+                break
+
+            path = self._path(month, coin_id)
+            if not os.path.exists(path) or not os.path.getsize(path):
+                continue
+            records = np.memmap(path, self.dtype, mode="r",
+                                shape=os.path.getsize(path) //
+                                self.dtype.itemsize)
+
+            lo, hi = 0, len(records)
+            if start is not None:
+                lo = np.searchsorted(records["time"], start, "left")
+            if end is not None:
+                hi = np.searchsorted(records["time"], end, "left")
+            if lo < hi:
+                parts.append(records[lo:hi])
+
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return np.zeros(0, self.dtype)
+        return np.concatenate(parts)
+
+    def latest(self, coin_id):
+        """Returns the last record of a coin, or None if there is none."""
+        for month in reversed(self.months()):
+            records = self.query(coin_id, *self._bounds(month))
+            if len(records):
+                return records[-1]
+        return None
+
+    def coins(self):
+        """Returns the ids of all coins with a record in the store."""
+        ids = set()
+        for month in self.months():
+            ids.update(urllib.parse.unquote(name) for name in
+                       os.listdir(os.path.join(self.root, month)))
+        return sorted(ids)
+
+    def months(self):
+        """Returns the names of the monthly segment directories in order."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if len(name) == 7 and name[4] == "-")
+
+    def prune(self, now=None):
+        """
+        Removes the monthly segments that ended more than retention_days
+        before now, a Unix time that defaults to the current time.
+        """
+        if self.retention_days is None:
+            return
+        if now is None:
+            now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+        oldest = self._segment(now - self.retention_days * 86400)
+        for month in self.months():
+            if month < oldest:
+                shutil.rmtree(os.path.join(self.root, month))
+
+    @staticmethod
+    def _segment(t):
+        return datetime.datetime.fromtimestamp(
+            t, datetime.timezone.utc).strftime("%Y-%m")
+
+    @staticmethod
+    def _bounds(month):
+        year, number = (int(x) for x in month.split("-"))
+        start = datetime.datetime(year, number, 1,
+                                  tzinfo=datetime.timezone.utc)
+        end = datetime.datetime(year + number // 12, number % 12 + 1, 1,
+                                tzinfo=datetime.timezone.utc)
+        return int(start.timestamp()), int(end.timestamp())
+
+    def _path(self, month, coin_id):
+        return os.path.join(self.root, month,
+                            urllib.parse.quote(coin_id, safe=""))
+
+    def _last_time(self, month, coin_id):
+        path = self._path(month, coin_id)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return -1
+        if size % self.dtype.itemsize:
+            # Drop a record that was cut short, so appends stay aligned
+            size -= size % self.dtype.itemsize
+            os.truncate(path, size)
+        if not size:
+            return -1
+        with open(path, "rb") as f:
+            f.seek(size - self.dtype.itemsize)
+            record = np.frombuffer(f.read(self.dtype.itemsize), self.dtype)
+        return int(record["time"][0])
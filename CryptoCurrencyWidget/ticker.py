@@ -0,0 +1,694 @@
+"""
+Access to the CoinMarketCap ticker that does not depend on Qt, shared by the
+worker threads of CryptoCurrencyUpdater.
+"""
+import codecs
+import decimal
+import hashlib
+import http.client
+import json
+import operator
+import random
+import socket
+import threading
+import urllib.error
+import urllib.parse
+import zlib
+
+ROOT_URL = "https://api.coinmarketcap.com/v1/ticker/"
+
+# Fields of a coin in the ticker and the types they are decoded to
+COIN_FIELDS = (
+    ("id", str), ("name", str), ("symbol", str), ("rank", int),
+    ("price_usd", float), ("price_btc", float), ("24h_volume_usd", float),
+    ("market_cap_usd", float), ("available_supply", float),
+    ("total_supply", float), ("max_supply", float),
+    ("percent_change_1h", float), ("percent_change_24h", float),
+    ("percent_change_7d", float), ("last_updated", int))
+
+# Attribute of CoinRecord that holds each field
+_ATTRIBUTES = {field: field if field.isidentifier() else "volume_24h_usd"
+               for field, kind in COIN_FIELDS}
+_DECODERS = tuple((field, _ATTRIBUTES[field], kind)
+                  for field, kind in COIN_FIELDS)
+_values = operator.attrgetter(*_ATTRIBUTES.values())
+
+
+def write_snapshot(f, coins):
+    """
+    Writes a snapshot, given as a list of CoinRecords, to a text file as one
+    JSON list per line.
+    """
+    f.write(json.dumps([coin.to_dict() for coin in coins]) + "\n")
+
+
+def read_snapshot(line):
+    """Decodes a line written by write_snapshot() into CoinRecords."""
+    return [CoinRecord.from_dict(coin) for coin in json.loads(line)]
+
+
+def format_value(value):
+    """Returns the text of a record value the way the ticker writes it."""
+    if value is None:
+        return ""
+    text = str(value)
+    if isinstance(value, float) and "e" in text:
+        text = format(decimal.Decimal(text), "f")
+    return text
+
+
+class CoinRecord(object):
+    """
+    One coin of the ticker with typed fields. Numbers are decoded once to
+    int or float, missing values are None, and the fields are stored in slots
+    instead of a dict of strings. Records behave as mappings keyed by the
+    field names of the ticker, so they can be used in place of the decoded
+    JSON objects. Fields that are not in COIN_FIELDS are kept in extra.
+    """
+    __slots__ = tuple(_ATTRIBUTES.values()) + ("extra",)
+
+    @classmethod
+    def from_dict(cls, coin):
+        """Decodes a coin object of the ticker."""
+        record = cls.__new__(cls)
+        get = coin.get
+        for field, attribute, kind in _DECODERS:
+            value = get(field)
+            if value is not None and kind is not str:
+                value = kind(value)
+            setattr(record, attribute, value)
+
+        record.extra = None
+        if len(coin) != len(_ATTRIBUTES) or coin.keys() != _ATTRIBUTES.keys():
+            extra = coin.keys() - _ATTRIBUTES.keys()
+            record.extra = {field: coin[field] for field in extra} or None
+        return record
+
+    def __getitem__(self, field):
+        attribute = _ATTRIBUTES.get(field)
+        if attribute is not None:
+            return getattr(self, attribute)
+        if self.extra is not None and field in self.extra:
+            return self.extra[field]
+        raise KeyError(field)
+
+    def __setitem__(self, field, value):
+        attribute = _ATTRIBUTES.get(field)
+        if attribute is not None:
+            setattr(self, attribute, value)
+        elif self.extra is None:
+            self.extra = {field: value}
+        else:
+            self.extra[field] = value
+
+    def __contains__(self, field):
+        return field in _ATTRIBUTES or (self.extra is not None and
+                                        field in self.extra)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(_ATTRIBUTES) + len(self.extra or ())
+
+    def __eq__(self, other):
+        if not hasattr(other, "items"):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "CoinRecord({!r})".format(self.to_dict())
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(_ATTRIBUTES) + list(self.extra or ())
+
+    def items(self):
+        items = [(field, getattr(self, attribute))
+                 for field, attribute in _ATTRIBUTES.items()]
+        if self.extra is not None:
+            items.extend(self.extra.items())
+        return items
+
+    def update(self, fields):
+        for field, value in fields.items():
+            self[field] = value
+
+    def changes(self, other):
+        """
+        Returns a dict of the fields whose value in other differs from this
+        record, leaving out the rank.
+        """
+        if _values(self) == _values(other) and self.extra == other.extra:
+            return {}
+        fields = {field: value for field, value in other.items()
+                  if field != "rank" and self.get(field) != value}
+        for field in (self.extra or {}).keys() - (other.extra or {}).keys():
+            fields[field] = None
+        return fields
+
+    def copy(self):
+        record = CoinRecord.__new__(CoinRecord)
+        for attribute in self.__slots__:
+            setattr(record, attribute, getattr(self, attribute))
+        if self.extra is not None:
+            record.extra = dict(self.extra)
+        return record
+
+    def to_dict(self):
+        """Returns the record as a dict that can be written as JSON."""
+        return dict(self.items())
+
+
+class RecordParser(object):
+    """
+    Decodes a JSON array of coins into CoinRecords while it is received.
+    Only the part of the text that does not form a complete coin yet is kept
+    between calls to feed(), so the full text and the decoded objects are
+    never in memory at the same time.
+    """
+
+    def __init__(self):
+        self.records = []
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._started = False
+        self._ended = False
+
+    def feed(self, data):
+        """Decodes the coins completed by the next bytes of the array."""
+        buffer = self._buffer + self._text.decode(data)
+        pos = 0
+        while not self._ended:
+            pos = self._skip(buffer, pos)
+            if pos == len(buffer):
+                break
+            if not self._started:
+                if buffer[pos] != "[":
+                    raise ValueError("Expected a JSON array of coins")
+                self._started = True
+                pos += 1
+            elif buffer[pos] == "]":
+                self._ended = True
+                pos += 1
+            else:
+                try:
+                    coin, end = self._decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    # The coin is not complete yet
+                    break
+                self.records.append(CoinRecord.from_dict(coin))
+                pos = end
+        self._buffer = buffer[pos:]
+
+    def close(self):
+        """Returns the records, raising ValueError if the array is cut off."""
+        self.feed(b"")
+        if not self._ended or self._buffer.strip():
+            raise ValueError("Incomplete JSON array of coins")
+        return self.records
+
+    @staticmethod
+    def _skip(buffer, pos):
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        return pos
+
+
+class Backoff(object):
+    """
+    Delays between polls: interval after a successful poll, and after
+    consecutive failures a delay that starts at retry and grows by factor up
+    to max_delay. Every delay is spread by a random fraction of up to jitter
+    either way, so clients started together do not poll in lockstep.
+    """
+
+    def __init__(self, interval, retry=15, max_delay=30 * 60, factor=2,
+                 jitter=0.1, rng=random):
+        self.interval = interval
+        self.retry = retry
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.failures = 0
+        self._rng = rng
+
+    def delay(self, failed=False):
+        """Returns the seconds to wait after a poll that failed or not."""
+        if failed:
+            self.failures += 1
+            delay = min(self.retry * self.factor ** (self.failures - 1),
+                        self.max_delay)
+        else:
+            self.failures = 0
+            delay = self.interval
+        return delay * (1 + self._rng.uniform(-self.jitter, self.jitter))
+
+
+def diff(previous, current):
+    """
+    Compares two ticker snapshots keyed by coin id and returns the change set
+    between them as a dict with the keys
+
+        added: {id: coin} of coins that are new in current
+        removed: {id: rank} of coins that are gone, with their last rank
+        changed: {id: {field: value}} of the fields whose value changed
+        reranked: {id: (old rank, new rank)} of coins that moved
+
+    A rank change is only reported under reranked. All values are empty if
+    nothing changed.
+    """
+    delta = {"added": dict(), "removed": dict(), "changed": dict(),
+             "reranked": dict()}
+
+    for coin_id, coin in current.items():
+        old = previous.get(coin_id)
+        if old is None:
+            delta["added"][coin_id] = coin
+            continue
+
+        if old is coin:
+            continue
+        if isinstance(old, CoinRecord) and isinstance(coin, CoinRecord):
+            fields = old.changes(coin)
+        else:
+            fields = {k: v for k, v in coin.items()
+                      if k != "rank" and old.get(k) != v}
+        if fields:
+            delta["changed"][coin_id] = fields
+        if old["rank"] != coin["rank"]:
+            delta["reranked"][coin_id] = (int(old["rank"]), int(coin["rank"]))
+
+    for coin_id, coin in previous.items():
+        if coin_id not in current:
+            delta["removed"][coin_id] = int(coin["rank"])
+
+    return delta
+
+
+class SnapshotPipeline(object):
+    """
+    The steps every new ticker snapshot goes through, shared by the widget
+    and headless.py. update() adds the prices in the given currencies with
+    fx, a currency.FxRates, and returns the change set against the previous
+    snapshot after checking it against the alert rules. Once the snapshot
+    was handed on, store() appends it to the history store and the record
+    file. None of the collaborators is required.
+    """
+
+    def __init__(self, currencies=(), fx=None, alerts=None, history=None,
+                 record=None):
+        self.currencies = [currency.upper() for currency in currencies]
+        self.fx = fx
+        self.alerts = alerts
+        self.history = history
+        self.record = record
+
+        # The latest snapshot as given and keyed by coin id
+        self.data = None
+        self.coins = dict()
+
+    def update(self, data):
+        """
+        Takes a snapshot, given as a list of CoinRecords in rank order, and
+        returns its change set against the previous one, see diff().
+        """
+        if self.currencies and self.fx is not None:
+            self.fx.add_prices(data, self.currencies)
+
+        current = {coin["id"]: coin for coin in data}
+        delta = diff(self.coins, current)
+        self.data = data
+        self.coins = current
+
+        if self.alerts is not None and any(delta.values()):
+            self.alerts.evaluate(delta)
+        return delta
+
+    def store(self, data):
+        """
+        Appends a snapshot to the history store and the record file. Writes
+        that fail are not raised, so they can not hold up the ticker, but
+        returned as a list of messages.
+        """
+        errors = []
+        if self.history is not None:
+            try:
+                self.history.append(data)
+            except Exception as e:
+                errors.append("history: {}: {}".format(type(e).__name__, e))
+        if self.record is not None:
+            try:
+                with open(self.record, "a") as f:
+                    write_snapshot(f, data)
+            except OSError as e:
+                errors.append("record: {}: {}".format(type(e).__name__, e))
+        return errors
+
+
+class CoinIndex(object):
+    """
+    Lookup structures over a ticker snapshot, kept up to date from the change
+    sets returned by diff(). Coins are keyed by their id, which is stable
+    between updates, with secondary indexes by symbol and rank and a prefix
+    trie over the id, symbol and name words for type-ahead search.
+    """
+
+    def __init__(self):
+        self.coins = dict()
+        self.by_rank = dict()
+        self.by_symbol = dict()
+        # Nested dicts keyed by character, with the ids of the coins whose
+        # key ends at a node stored under ""
+        self._trie = dict()
+
+    def __len__(self):
+        return len(self.coins)
+
+    def __contains__(self, coin_id):
+        return coin_id in self.coins
+
+    def get(self, coin_id, default=None):
+        return self.coins.get(coin_id, default)
+
+    def rank(self, coin_id):
+        """Returns the current rank of a coin, or None if it is not listed."""
+        coin = self.coins.get(coin_id)
+        return None if coin is None else int(coin["rank"])
+
+    def symbol(self, symbol):
+        """Returns the ids of the coins with the given symbol."""
+        return sorted(self.by_symbol.get(symbol.upper(), ()), key=self.rank)
+
+    def update(self, coins):
+        """
+        Brings the index up to date with a full snapshot keyed by coin id and
+        returns the change set that was applied.
+        """
+        delta = diff(self.coins, coins)
+        self.apply(delta)
+        return delta
+
+    def apply(self, delta):
+        """Updates the index with a change set returned by diff()."""
+        for coin_id in delta["removed"]:
+            coin = self.coins.pop(coin_id)
+            self._unindex(coin_id, coin)
+            if self.by_rank.get(int(coin["rank"])) is coin:
+                del self.by_rank[int(coin["rank"])]
+
+        for coin_id, (old_rank, _) in delta["reranked"].items():
+            if self.by_rank.get(old_rank) is self.coins[coin_id]:
+                del self.by_rank[old_rank]
+
+        for coin_id, coin in delta["added"].items():
+            coin = coin.copy()
+            self.coins[coin_id] = coin
+            self.by_rank[int(coin["rank"])] = coin
+            self._index(coin_id, coin)
+
+        for coin_id, fields in delta["changed"].items():
+            coin = self.coins[coin_id]
+            if "name" in fields or "symbol" in fields:
+                self._unindex(coin_id, coin)
+                coin.update(fields)
+                self._index(coin_id, coin)
+            else:
+                coin.update(fields)
+
+        for coin_id, (_, rank) in delta["reranked"].items():
+            coin = self.coins[coin_id]
+            coin["rank"] = rank
+            self.by_rank[rank] = coin
+
+    def prefix(self, text, limit=None):
+        """
+        Returns the ids of the coins whose id, symbol or a word of whose name
+        starts with text, ordered by rank. With several words in text every
+        word has to match. Returns all coins for empty text.
+        """
+        found = None
+        for word in text.lower().split():
+            ids = self._search(word)
+            found = ids if found is None else found & ids
+            if not found:
+                return []
+
+        if found is None:
+            found = self.coins
+        return sorted(found, key=self.rank)[:limit]
+
+    def _search(self, word):
+        node = self._trie
+        for char in word:
+            node = node.get(char)
+            if node is None:
+                return set()
+
+        found = set()
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for char, child in node.items():
+                if char:
+                    stack.append(child)
+                else:
+                    found.update(child)
+        return found
+
+    @staticmethod
+    def _keys(coin_id, coin):
+        keys = {coin_id.lower(), (coin.get("symbol") or "").lower()}
+        keys.update((coin.get("name") or "").lower().split())
+        keys.discard("")
+        return keys
+
+    def _index(self, coin_id, coin):
+        symbol = (coin.get("symbol") or "").upper()
+        self.by_symbol.setdefault(symbol, set()).add(coin_id)
+
+        for key in self._keys(coin_id, coin):
+            node = self._trie
+            for char in key:
+                node = node.setdefault(char, dict())
+            node.setdefault("", set()).add(coin_id)
+
+    def _unindex(self, coin_id, coin):
+        symbol = (coin.get("symbol") or "").upper()
+        ids = self.by_symbol.get(symbol)
+        if ids is not None:
+            ids.discard(coin_id)
+            if not ids:
+                del self.by_symbol[symbol]
+
+        for key in self._keys(coin_id, coin):
+            path = [self._trie]
+            for char in key:
+                path.append(path[-1][char])
+            path[-1][""].discard(coin_id)
+            if not path[-1][""]:
+                del path[-1][""]
+            # Prune the nodes left without ids or children
+            for k in range(len(key), 0, -1):
+                if path[k]:
+                    break
+                del path[k - 1][key[k - 1]]
+
+
+class TickerClient(object):
+    """
+    HTTP client for the ticker API that keeps one connection alive between
+    polls and sends conditional requests, so an unchanged ticker costs a
+    304 response instead of a full download. Responses whose body did not
+    change are skipped as well in case the server ignores the validators:
+    the body is compared block by block with the previous one and is only
+    passed on, and so parsed, from the first block that differs.
+    The validators of a response are only kept once its body was used, see
+    commit(), so a response that could not be handled is downloaded again.
+    A single client can be shared between threads.
+    """
+
+    def __init__(self, root_url=ROOT_URL, timeout=30):
+        url = urllib.parse.urlsplit(root_url)
+        self.root_url = root_url
+        self._connection_class = (http.client.HTTPSConnection
+                                  if url.scheme == "https"
+                                  else http.client.HTTPConnection)
+        self._host = url.netloc
+        self._path = url.path or "/"
+        self._timeout = timeout
+
+        self._conn = None
+        self._lock = threading.Lock()
+        # Set while close() interrupts a request of another thread
+        self._interrupted = False
+        # Validators and block digests of the last response that was used,
+        # and of the last one received, per query
+        self._cache = dict()
+        self._pending = dict()
+
+    def get(self, query="", commit=True):
+        """
+        Returns the decoded JSON response for root_url + query, or None if it
+        did not change since the previous committed response to the same
+        query. Unless commit is False, the response is committed once it was
+        decoded.
+        """
+        chunks = []
+        if not self._fetch(query, chunks.append):
+            return None
+        data = json.loads(b"".join(chunks).decode())
+        if commit:
+            self.commit(query)
+        return data
+
+    def get_coins(self, query="", commit=True):
+        """
+        Returns the coins of the ticker response for root_url + query as a
+        list of CoinRecords, or None if it did not change since the previous
+        committed response to the same query. The coins are decoded while the
+        response is received. Unless commit is False, the response is
+        committed once it was decoded.
+        """
+        parser = RecordParser()
+        if not self._fetch(query, parser.feed):
+            return None
+        coins = parser.close()
+        if commit:
+            self.commit(query)
+        return coins
+
+    def commit(self, query=""):
+        """
+        Marks the last response to root_url + query as used, so that the next
+        request is conditional on it and returns None while it is unchanged.
+        Callers that pass commit=False to get() or get_coins() call this once
+        they handled the result.
+        """
+        path = self._path + query
+        entry = self._pending.pop(path, None)
+        if entry is not None:
+            self._cache[path] = entry
+
+    def close(self):
+        """
+        Closes the connection. A request that another thread is waiting for
+        is interrupted at once and raises OSError there.
+        """
+        conn = self._conn
+        if conn is not None and conn.sock is not None:
+            self._interrupted = True
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        with self._lock:
+            self._interrupted = False
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _fetch(self, query, consume, chunk_size=65536):
+        """
+        Passes the decompressed body of the response for root_url + query to
+        consume() in blocks of chunk_size. Returns whether the body changed
+        since the previous committed response, whose validators are kept for
+        commit(). Leading blocks that are equal to those of the previous body
+        are held back until one differs, and are never passed on if the whole
+        body is equal.
+        """
+        path = self._path + query
+        etag, modified, previous = self._cache.get(path, (None, None, None))
+
+        headers = {"Accept-Encoding": "gzip"}
+        if etag:
+            headers["If-None-Match"] = etag
+        if modified:
+            headers["If-Modified-Since"] = modified
+
+        with self._lock:
+            response = self._request(path, headers)
+            if response.status != 200:
+                response.read()
+                if response.status == 304:
+                    return False
+                raise urllib.error.HTTPError(self.root_url + query,
+                                             response.status, response.reason,
+                                             response.headers, None)
+
+            decompress = None
+            if response.getheader("Content-Encoding") == "gzip":
+                decompress = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+            digests = []
+            held = [] if previous is not None else None
+
+            def block(data):
+                nonlocal held
+                digests.append(hashlib.sha1(data).digest())
+                if held is not None:
+                    i = len(digests) - 1
+                    if i < len(previous) and previous[i] == digests[i]:
+                        held.append(data)
+                        return
+                    for data_held in held:
+                        consume(data_held)
+                    held = None
+                consume(data)
+
+            buf = bytearray()
+            try:
+                while True:
+                    chunk = response.read(chunk_size)
+                    if not chunk:
+                        break
+                    if decompress is not None:
+                        chunk = decompress.decompress(chunk)
+                    buf += chunk
+                    while len(buf) >= chunk_size:
+                        block(bytes(buf[:chunk_size]))
+                        del buf[:chunk_size]
+                if decompress is not None:
+                    buf += decompress.flush()
+                if buf:
+                    block(bytes(buf))
+            except Exception:
+                # The rest of the response can not be told from the next one
+                self._conn.close()
+                self._conn = None
+                raise
+
+        if held is not None:
+            if len(digests) == len(previous):
+                return False
+            # The body is a shortened copy of the previous one
+            for data in held:
+                consume(data)
+        self._pending[path] = (response.getheader("ETag"),
+                               response.getheader("Last-Modified"),
+                               tuple(digests))
+        return True
+
+    def _request(self, path, headers):
+        # A kept-alive connection may have been closed by the server since
+        # the last poll, so retry once on a fresh connection.
+        for retry in (False, True):
+            if self._conn is None:
+                self._conn = self._connection_class(self._host,
+                                                    timeout=self._timeout)
+            try:
+                self._conn.request("GET", path, headers=headers)
+                return self._conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                self._conn.close()
+                self._conn = None
+                if retry or self._interrupted:
+                    raise
@@ -1,15 +1,141 @@
 """
 
 """
+import functools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import numpy as np
 
 
+def _amortize(r, a, pay, balance, count, width=None):
+    """Vectorized engine behind :func:`amortization`.
+
+    Computes a batch of amortization schedules with array operations instead
+    of stepping through the periods one at a time. Because every period is
+    rounded to the cent the balance cannot be written in closed form, so the
+    closed-form balance is only used as a first guess. Each pass then
+    recomputes interest, principal and balance for all periods from the
+    previous guess in bulk and keeps the leading periods that already
+    reproduce the per-period recurrence exactly. The interest of a period is
+    insensitive to small errors in the balance, so only a few passes are
+    needed, and every pass fixes at least one more period. Large batches are
+    worked through in blocks of periods so the guess stays close and paid off
+    loans drop out early.
+
+    :param r:
+        (S,) interest rate per period expressed as a decimal
+    :param a:
+        (S,) regular payment amount; once the balance drops below it the
+        remaining balance is paid off in the next period
+    :param pay:
+        (S, L) payment scheduled for each period
+    :param balance:
+        (S,) balance before the first period
+    :param count:
+        (S,) number of periods of each schedule checked for early payoff
+    :param width:
+        number of periods per block, by default sized to the batch
+
+    :return: principal, interest, balance
+        (S, L + 1) arrays, the last column holding a final payoff that falls
+        after the L scheduled periods
+    """
+
+    n_sched, n_per = pay.shape
+    p = np.zeros((n_sched, n_per + 1), dtype=float)
+    i = np.zeros((n_sched, n_per + 1), dtype=float)
+    bal = np.zeros((n_sched, n_per + 1), dtype=float)
+    if width is None:
+        width = max(65536 // max(n_sched, 1), 32)
+
+    payoff = np.full(n_sched, -1)
+    start = np.array(balance, dtype=float)
+    running = np.arange(n_sched)
+    for c0 in range(0, n_per, width):
+        running = running[(payoff[running] < 0) & (count[running] > c0)]
+        if not running.size:
+            break
+        col = np.arange(c0, min(c0 + width, n_per))
+
+        # First guess from the closed-form balance without rounding,
+        # B[n] = (1 + r)**n * (B[0] - sum(pay[t] / (1 + r)**t for t <= n)),
+        # with the interest it implies rounded to the cent.
+        b0 = start[running, None]
+        rate = r[running, None]
+        blk = pay[running, c0:col[-1] + 1]
+        with np.errstate(all="ignore"):
+            grow = np.cumprod(np.repeat(1 + rate, col.size, axis=1), axis=1)
+            guess = grow * (b0 - np.cumsum(blk / grow, axis=1))
+            guess = np.round(b0 - np.cumsum(np.round(blk - np.round(
+                np.hstack((b0, guess[:, :-1])) * rate, 2), 2), axis=1), 2)
+
+        live = col < count[running, None]
+        low_at = a[running, None]
+        known = np.full(running.size, -1)
+        todo = np.arange(running.size)
+        while todo.size:
+            prev = np.hstack((b0[todo], guess[todo, :-1]))
+            it = np.round(prev * rate[todo], 2)
+            pt = np.round(blk[todo] - it, 2)
+            bt = np.round(prev - pt, 2)
+
+            # Periods up to and including the first mismatch follow from an
+            # exact previous balance, so they are final.
+            ok = live[todo]
+            bad = (bt != guess[todo]) & ok & (col - c0 > known[todo, None])
+            first_bad = np.where(bad.any(axis=1), bad.argmax(axis=1), n_per)
+            low = (bt < low_at[todo]) & ok
+            first_low = np.where(low.any(axis=1), low.argmax(axis=1), n_per)
+            done = (first_low <= first_bad) | (first_bad == n_per)
+
+            fin = running[todo[done]]
+            p[fin, c0:col[-1] + 1] = pt[done]
+            i[fin, c0:col[-1] + 1] = it[done]
+            bal[fin, c0:col[-1] + 1] = bt[done]
+            start[fin] = bt[done, -1]
+            payoff[fin] = np.where(first_low[done] < n_per,
+                                   c0 + first_low[done], -1)
+
+            keep = ~done
+            known[todo[keep]] = first_bad[keep]
+            guess[todo[keep]] = np.where(
+                col - c0 <= first_bad[keep, None], bt[keep],
+                np.round(b0[todo[keep]] - np.cumsum(pt[keep], axis=1), 2))
+            todo = todo[keep]
+
+    # Zero everything after the last period, then pay off what is left in the
+    # period after the balance first dropped below the regular payment.
+    last = np.where(payoff >= 0, payoff + 1, count)
+    after = np.arange(n_per + 1) >= last[:, None]
+    p[after] = 0
+    i[after] = 0
+    bal[after] = 0
+
+    rows = np.flatnonzero(payoff >= 0)
+    n = payoff[rows] + 1
+    b = bal[rows, n - 1]
+    i[rows, n] = np.round(b * r[rows], 2)
+    final = np.round(b + i[rows, n], 2)
+    p[rows, n] = np.round(final - i[rows, n], 2)
+    bal[rows, n] = np.round(b - p[rows, n], 2)
+
+    return p, i, bal
+
+
 # Equation for amortization: A = P[(r(1+r)**n)/((1+r)**n-1)],
 # where A is payment amount per period, P is principle, r is interest rate per
 # period expressed as a decimal, and n is number of payments.
+@functools.lru_cache(maxsize=256)
 def amortization(rate, number, principal, extra=0, extra_start=0):
     """This method calculates and returns an amortization schedule based on an
     interest rate, number of payments, and initial principal
+
+    Schedules are kept in a least-recently-used cache keyed on the arguments,
+    so repeated what-if calls with the same loan are free. The returned
+    arrays are shared between callers and therefore read-only. Cache
+    statistics are available from amortization.cache_info().
     
     :param rate: 
         interest rate expressed as a percentage
@@ -27,9 +153,6 @@ def amortization(rate, number, principal, extra=0, extra_start=0):
     """
 
     r = rate / 12 / 100
-    i = np.zeros((number + 1,), dtype=float)
-    p = np.zeros((number + 1,), dtype=float)
-    bal = np.zeros((number + 1,), dtype=float)
 
     a = np.round(principal * ((r * (1 + r) ** number) /
                               ((1 + r) ** number - 1)), 2)
@@ -37,34 +160,254 @@ def amortization(rate, number, principal, extra=0, extra_start=0):
     pay = np.ones((number + 1,), dtype=float) * a
     pay[extra_start:] += extra
 
-    bal[0] = principal
+    p, i, bal = _amortize(np.array([r]), np.array([a]), pay[None, 1:number],
+                          np.array([principal], dtype=float),
+                          np.array([number - 1]))
+
+    p, i, bal = p[0, :number], i[0, :number], bal[0, :number]
+    for x in (p, i, bal):
+        x.flags.writeable = False
+
+    return a, p, i, bal
+
+
+def reamortize(schedule, rate, number, principal, period, extra=0):
+    """Updates a schedule from :func:`amortization` after the extra payment
+    changes from a given period on. The periods before it are reused as they
+    are and only the remaining ones are recomputed, so the work is
+    proportional to number - period.
+
+    :param schedule:
+        amount, principal, interest and balance as returned by amortization()
+    :param rate:
+        interest rate expressed as a percentage
+    :param number:
+        number of payments or periods
+    :param principal:
+        principal amount
+    :param period:
+        payment number from which the new extra payment applies
+    :param extra:
+        extra amount to apply to principal from period on, replacing any
+        earlier extra payment
+
+    :return: Amount
+        amount, principal, interest and balance like amortization()
+    """
+
+    a, p, i, bal = schedule
+    k = max(int(period), 1)
+
+    # Nothing changes if the loan was already paid off before period, or if
+    # only the final period, which pays whatever is left, is affected.
+    if k >= number or np.any(bal[:k - 1] < a):
+        return schedule
+
+    r = rate / 12 / 100
+    start = principal if k == 1 else bal[k - 2]
+    p_k, i_k, bal_k = _amortize(np.array([r]), np.array([a]),
+                                np.full((1, number - k), a + extra),
+                                np.array([start], dtype=float),
+                                np.array([number - k]))
+
+    return (a, np.concatenate((p[:k - 1], p_k[0])),
+            np.concatenate((i[:k - 1], i_k[0])),
+            np.concatenate((bal[:k - 1], bal_k[0])))
+
+
+def _round(x):
+    """Same as np.round(x, 2) for a float, without the numpy overhead."""
+    return round(x * 100) / 100
+
+
+def amortization_rows(rate, number, principal, extra=0, extra_start=0,
+                      frequency=12):
+    """Generates the amortization schedule lazily, one period at a time,
+    instead of allocating arrays for all periods like :func:`amortization`.
+    With the default frequency the rows are the same as amortization()'s.
+
+    :param rate:
+        interest rate expressed as a percentage
+    :param number:
+        number of payments or periods
+    :param principal:
+        principal amount
+    :param extra:
+        extra amount to apply to principal
+    :param extra_start:
+        payment number to start extra payments
+    :param frequency:
+        number of periods per year, e.g. 26 for bi-weekly or 365 for daily
+
+    :return:
+        generator of (period, payment, principal, interest, balance) for every
+        period with a payment
+    """
+
+    r = rate / frequency / 100
+    a = _round(principal * ((r * (1 + r) ** number) /
+                            ((1 + r) ** number - 1)))
+
+    # Same indexing as pay[extra_start:] in amortization()
+    start = extra_start if extra_start >= 0 else number + 1 + extra_start
+    bal = float(principal)
     for n in range(1, number):
-        i[n] = np.round(bal[n - 1] * r, 2)
-        p[n] = np.round(pay[n] - i[n], 2)
+        pay = a + extra if n >= start else a
+        i = _round(bal * r)
+        p = _round(pay - i)
+        bal = _round(bal - p)
+        yield n, pay, p, i, bal
 
-        bal[n] = np.round(bal[n - 1] - p[n], 2)
+        if bal < a:
+            i = _round(bal * r)
+            pay = _round(bal + i)
+            p = _round(pay - i)
+            yield n + 1, pay, p, i, _round(bal - p)
+            return
 
-        # print("{:3.0f}:  $ {:7.2f}\t $ {:7.2f}\t $ {:7.2f}\t $ {:9.2f}"
-        #       "".format(n, np.round(pay[n], 2), np.round(p[n], 2),
-        #                 np.round(i[n], 2), np.round(bal[n], 2)))
 
-        if bal[n] < a:
-            n += 1
-            i[n] = np.round(bal[n - 1] * r, 2)
-            pay[n] = np.round(bal[n - 1] + i[n], 2)
-            p[n] = np.round(pay[n] - i[n], 2)
-            bal[n] = np.round(bal[n - 1] - p[n], 2)
+def amortization_summary(rate, number, principal, extra=0, extra_start=0,
+                         frequency=12):
+    """Reduces :func:`amortization_rows` to totals in constant memory, for
+    callers that only need the totals or the payoff period.
 
-            # print("{:3.0f}:  $ {:7.2f}\t $ {:7.2f}\t $ {:7.2f}\t $ {:9.2f}"
-            #       "".format(n, np.round(pay[n], 2), np.round(p[n], 2),
-            #                 np.round(i[n], 2), np.round(bal[n], 2)))
+    :return:
+        dict with the regular "payment", the number of "periods" with a
+        payment, which is also the payoff period, and the total "paid",
+        "principal" and "interest"
+    """
 
-            break
+    periods, paid, principal_paid, interest = 0, 0.0, 0.0, 0.0
+    for periods, pay, p, i, _ in amortization_rows(
+            rate, number, principal, extra, extra_start, frequency):
+        paid += pay
+        principal_paid += p
+        interest += i
+
+    r = rate / frequency / 100
+    return {
+        "payment": _round(principal * ((r * (1 + r) ** number) /
+                                       ((1 + r) ** number - 1))),
+        "periods": periods,
+        "paid": _round(paid),
+        "principal": _round(principal_paid),
+        "interest": _round(interest),
+    }
+
+
+def _payment(r, number, principal):
+    """Payment per period of a batch of loans, see :func:`amortization`."""
+
+    # Evaluate the power per loan so the payment matches amortization() to
+    # the last bit, the array power may round differently.
+    growth = np.array([(1 + x) ** n for x, n in
+                       zip(r.tolist(), number.tolist())], dtype=float)
+    with np.errstate(all="ignore"):
+        return np.round(principal * ((r * growth) / (growth - 1)), 2)
+
+
+def _schedules(r, number, principal, extra, start, chunk_size):
+    """Generates the amortization schedules of a batch of loans a chunk at a
+    time, yielding slice, payment, principal, interest and balance. The
+    schedule arrays of a chunk have as many columns as its longest loan."""
+
+    a = _payment(r, number, principal)
+    for lo in range(0, r.size, chunk_size):
+        s = slice(lo, lo + chunk_size)
+        period = np.arange(1, max(int(number[s].max()), 1))
+        pay = np.where(period >= start[s, None], (a[s] + extra[s])[:, None],
+                       a[s, None])
+        p, i, bal = _amortize(r[s], a[s], pay, principal[s], number[s] - 1)
+        yield s, a[s], p, i, bal
+
+
+def amortization_batch(rate, number, principal, extra=0, extra_start=0,
+                       chunk_size=4096):
+    """Calculates the amortization schedules of a whole grid of loans in one
+    call. Every argument may be a scalar or an array; they are broadcast
+    against each other and flattened into a list of scenarios. Each scenario
+    gives exactly the same schedule as calling :func:`amortization` with the
+    corresponding values.
+
+    :param rate:
+        interest rate expressed as a percentage
+    :param number:
+        number of payments or periods
+    :param principal:
+        principal amount
+    :param extra:
+        extra amount to apply to principal
+    :param extra_start:
+        payment number to start extra payments
+    :param chunk_size:
+        number of scenarios computed at a time, bounds the scratch memory
+
+    :return: amount, principal, interest, balance, totals
+        amount is the (S,) payment per period. principal, interest and
+        balance are (S, max(number)) arrays, zero after a loan is paid off.
+        totals is a dict of (S,) arrays: "interest" paid, "months" with a
+        payment, and "interest_saved" and "months_saved" compared with the
+        same loan without extra payments.
+    """
+
+    rate, number, principal, extra, extra_start = (
+        np.ravel(x) for x in np.broadcast_arrays(
+            rate, number, principal, extra, extra_start))
+    number = number.astype(int)
+    principal = principal.astype(float)
+    extra = extra.astype(float)
+    # Same indexing as pay[extra_start:] in amortization()
+    start = np.where(extra_start < 0,
+                     np.maximum(number + 1 + extra_start, 0), extra_start)
+
+    n_sched = rate.size
+    n_max = max(int(number.max(initial=0)), 1)
+    a = np.zeros(n_sched, dtype=float)
+    p = np.zeros((n_sched, n_max), dtype=float)
+    i = np.zeros((n_sched, n_max), dtype=float)
+    bal = np.zeros((n_sched, n_max), dtype=float)
+    for s, a_s, p_s, i_s, bal_s in _schedules(
+            rate / 12 / 100, number, principal, extra, start, chunk_size):
+        n = p_s.shape[1]
+        a[s], p[s, :n], i[s, :n], bal[s, :n] = a_s, p_s, i_s, bal_s
 
-    return a, p[1:], i[1:], bal[1:]
+    interest = i.sum(axis=1)
+    months = np.count_nonzero(p > 0, axis=1)
+    base_interest = interest.copy()
+    base_months = months.copy()
 
+    # Loans with extra payments are compared with the plain schedule, which
+    # is shared by every scenario of the same loan.
+    rows = np.flatnonzero((extra != 0) & (np.maximum(start, 1) < number))
+    if rows.size:
+        loans, idx = np.unique(
+            np.stack((rate[rows], number[rows], principal[rows]), axis=1),
+            axis=0, return_inverse=True)
+        l_rate, l_number, l_principal = loans.T
+        l_number = l_number.astype(int)
+        none = np.zeros(len(loans))
+        l_interest = np.zeros(len(loans))
+        l_months = np.zeros(len(loans), dtype=int)
+        for s, _, p_s, i_s, _ in _schedules(
+                l_rate / 12 / 100, l_number, l_principal, none,
+                none.astype(int), chunk_size):
+            l_interest[s] = i_s.sum(axis=1)
+            l_months[s] = np.count_nonzero(p_s > 0, axis=1)
+        base_interest[rows] = l_interest[idx.ravel()]
+        base_months[rows] = l_months[idx.ravel()]
 
-def invest(rate, number, principal, years, extra=0, extra_start=0):
+    totals = {
+        "interest": interest,
+        "interest_saved": base_interest - interest,
+        "months": months,
+        "months_saved": base_months - months,
+    }
+
+    return a, p, i, bal, totals
+
+
+def invest(rate, number, principal, years, extra=0, extra_start=0,
+           trajectory=False):
     """
     :param rate: 
         interest rate expressed as a percentage
@@ -78,17 +421,388 @@ def invest(rate, number, principal, years, extra=0, extra_start=0):
         extra amount to apply each period
     :param extra_start:
         payment number to start extra payments
+    :param trajectory:
+        also return the value after every period
     :return: 
+        future value, rounded to the cent. rate, number, principal, years and
+        extra may be arrays, which are broadcast against each other. With
+        trajectory the value after each period is returned as well, as an
+        array with one more trailing axis that holds the value after 0 to
+        int(number * years) periods and keeps the final value once a shorter
+        investment has ended. The closed form is more accurate than the
+        per-period loop it replaced and can differ from it by one cent at
+        large balances or with daily compounding.
+    """
+
+    # With a constant contribution the compounding loop
+    #     a = a * (1 + x) + extra
+    # has the closed form a = P * g**m + extra * (g**m - 1) / x, g = 1 + x.
+    x = np.asarray(rate) / 100 / number
+    m = np.trunc(np.asarray(number) * years)
+    if trajectory:
+        m = m[..., None] if np.ndim(m) else m
+        m = np.minimum(np.arange(int(np.max(m)) + 1), m)
+        x, principal, extra = (
+            np.asarray(v)[..., None] if np.ndim(v) else v
+            for v in (x, principal, extra))
+
+    log_growth = m * np.log1p(x)
+    with np.errstate(all="ignore"):
+        annuity = np.where(x == 0, m, np.expm1(log_growth) / x)
+    a = np.round(principal * np.exp(log_growth) + extra * annuity, 2)
+
+    if trajectory:
+        return a[..., -1], a
+    return a[()]
+
+
+def net_worth(rate, number, principal, budget, extra, extra_start,
+              investments=0, invest_rate=10):
+    """Net worth at the end of the loan term when a monthly budget on top of
+    the regular payment is split between prepaying the loan and investing.
+
+    From extra_start on, extra of the budget goes to the loan as in
+    :func:`amortization`. Everything else is invested every month with the
+    same compounding as :func:`invest`: the budget before extra_start, the
+    rest of the budget afterwards, and the freed-up payment plus the budget
+    once the loan is paid off.
+
+    :param rate:
+        loan interest rate expressed as a percentage
+    :param number:
+        number of payments or periods
+    :param principal:
+        principal amount
+    :param budget:
+        amount available each month on top of the regular payment
+    :param extra:
+        extra amount to apply to principal, at most budget
+    :param extra_start:
+        payment number to start extra payments
+    :param investments:
+        amount invested at the start
+    :param invest_rate:
+        annual investment return expressed as a percentage
+    :return:
+        value of the investments after number months, one per broadcast
+        (extra, extra_start) pair
+    """
+
+    a, p, i, _, _ = amortization_batch(rate, number, principal, extra,
+                                       extra_start)
+    contributions = a[:, None] + budget - (p + i)
+
+    # Contribution t compounds for the remaining number - t months.
+    growth = 1 + invest_rate / 100 / 12
+    weights = growth ** np.arange(number - 1, -1, -1)
+    return np.round(investments * growth ** number + contributions @ weights,
+                    2)
+
+
+def optimize_extra(rate, number, principal, budget, investments=0,
+                   invest_rate=10, split=True, grid=9, tol=1):
+    """Finds the extra payment and start month that maximize
+    :func:`net_worth`.
+
+    Each round evaluates a grid of candidates in one batch and then narrows
+    the search box around the best one, so only a few hundred schedules are
+    computed instead of every combination.
+
+    :param rate:
+        loan interest rate expressed as a percentage
+    :param number:
+        number of payments or periods
+    :param principal:
+        principal amount
+    :param budget:
+        amount available each month on top of the regular payment
+    :param investments:
+        amount invested at the start
+    :param invest_rate:
+        annual investment return expressed as a percentage
+    :param split:
+        search how much of the budget to prepay; otherwise the whole budget
+        is prepaid and only the start month is searched
+    :param grid:
+        number of candidates per parameter and round, at least 4 so that
+        the search box shrinks every round
+    :param tol:
+        resolution of the extra payment
+    :return:
+        dict with the best "extra", "extra_start" and "net_worth", the
+        "baseline" net worth of investing the whole budget, and the number of
+        "evaluations"
     """
 
-    r = rate / 100
+    if grid < 4:
+        raise ValueError("grid must be at least 4, got {}".format(grid))
+    x_lo, x_hi = (0.0, float(budget)) if split else (float(budget),) * 2
+    s_lo, s_hi = 1, number
+    baseline = net_worth(rate, number, principal, budget, 0, 0, investments,
+                         invest_rate)[0]
+    best = (baseline, 0.0, number)
+    evaluations = 1
+    while True:
+        xs = np.unique(np.round(np.linspace(x_lo, x_hi, grid), 2))
+        ss = np.unique(np.round(np.linspace(s_lo, s_hi, grid)).astype(int))
+        x, s = (v.ravel() for v in np.meshgrid(xs, ss))
+        value = net_worth(rate, number, principal, budget, x, s, investments,
+                          invest_rate)
+        evaluations += value.size
+        k = np.argmax(value)
+        if value[k] > best[0]:
+            best = (value[k], x[k], s[k])
+
+        if x_hi - x_lo <= tol and s_hi - s_lo <= grid:
+            break
+        # Keep the neighbouring grid points around the best candidate.
+        dx = (x_hi - x_lo) / (grid - 1)
+        ds = (s_hi - s_lo) / (grid - 1)
+        box = (x_lo, x_hi, s_lo, s_hi)
+        x_lo, x_hi = max(x[k] - dx, x_lo), min(x[k] + dx, x_hi)
+        s_lo, s_hi = max(int(s[k] - ds), s_lo), min(int(np.ceil(s[k] + ds)),
+                                                    s_hi)
+        if (x_lo, x_hi, s_lo, s_hi) == box:
+            # Rounding left the box as it was, so another round is the same
+            break
+
+    return {
+        "extra": float(best[1]),
+        "extra_start": int(best[2]),
+        "net_worth": float(best[0]),
+        "baseline": float(baseline),
+        "evaluations": evaluations,
+    }
 
-    a = principal
-    for i in range(int(number * years)):
-        a = a * (1 + r / number) + extra
-    a = np.round(a, 2)
 
-    return a
+def load_returns(path, column=0):
+    """Loads historical monthly returns for :func:`simulate_invest` from a
+    CSV file. Rows that do not parse as numbers, such as a header, are
+    skipped.
+
+    :param path:
+        CSV file
+    :param column:
+        index of the column holding the returns expressed as a percentage
+    :return:
+        1-D array of monthly returns expressed as a percentage
+    """
+
+    returns = np.atleast_1d(np.genfromtxt(path, delimiter=",",
+                                          usecols=column))
+    return returns[~np.isnan(returns)]
+
+
+def simulate_invest(principal, months, extra=0, paths=10000, rate=10,
+                    volatility=15, returns=None, step=12, seed=None,
+                    chunk_size=8192):
+    """Monte Carlo counterpart of :func:`invest` with random monthly returns.
+
+    By default monthly returns are lognormal with an expected growth of
+    rate / 12 per month, the same as the deterministic invest(), and the given
+    annual volatility. Passing historical monthly returns instead bootstraps
+    every month from them. Paths are simulated chunk_size at a time, and only
+    the values at the checkpoints are kept, so memory is bounded by
+    paths * len(checkpoints) regardless of the horizon.
+
+    :param principal:
+        principal amount
+    :param months:
+        number of months money is invested
+    :param extra:
+        extra amount to apply each month
+    :param paths:
+        number of simulated return paths
+    :param rate:
+        expected annual return expressed as a percentage
+    :param volatility:
+        annual volatility expressed as a percentage
+    :param returns:
+        monthly returns expressed as a percentage to bootstrap from, e.g.
+        from load_returns()
+    :param step:
+        number of months between checkpoints
+    :param seed:
+        seed of the random number generator
+    :param chunk_size:
+        number of paths simulated at a time
+    :return: checkpoints, values
+        months at which values are recorded, ending with months, and the
+        (paths, len(checkpoints)) values of the investment at those months
+    """
+
+    months = int(months)
+    rng = np.random.default_rng(seed)
+    checkpoints = np.unique(np.append(np.arange(step, months, step), months))
+    values = np.zeros((paths, checkpoints.size), dtype=float)
+
+    sigma = volatility / 100 / np.sqrt(12)
+    mu = np.log1p(rate / 100 / 12) - sigma ** 2 / 2
+    for lo in range(0, paths, chunk_size):
+        n = min(chunk_size, paths - lo)
+        if returns is None:
+            log_growth = rng.normal(mu, sigma, (n, months))
+        else:
+            log_growth = np.log1p(rng.choice(returns, (n, months)) / 100)
+
+        # a[k] = a[k - 1] * g[k] + extra over all paths at once:
+        # a[k] = G[k] * (principal + extra * sum(1 / G[j] for j <= k)),
+        # where G[k] is the growth over the first k months.
+        growth = np.exp(np.cumsum(log_growth, axis=1))
+        value = growth * (principal + extra * np.cumsum(1 / growth, axis=1))
+        values[lo:lo + n] = value[:, checkpoints - 1]
+
+    return checkpoints, values
+
+
+def monte_carlo(rate, number, principal, extra, extra_start, investments,
+                invest_rate=10, volatility=15, returns=None, paths=10000,
+                percentiles=(5, 25, 50, 75, 95), seed=None, chunk_size=8192):
+    """Compares paying extra on a loan with investing it under random returns.
+
+    The interest saved by the extra payments comes from
+    :func:`amortization`. The investment side follows the script below:
+    investments plus extra each month are invested for the months between the
+    start of the extra payments and the payoff, with returns simulated by
+    :func:`simulate_invest`.
+
+    :param rate:
+        loan interest rate expressed as a percentage
+    :param number:
+        number of payments or periods
+    :param principal:
+        principal amount
+    :param extra:
+        extra amount to apply to principal
+    :param extra_start:
+        payment number to start extra payments
+    :param investments:
+        amount invested at the start
+    :param invest_rate:
+        expected annual return expressed as a percentage
+    :param volatility:
+        annual volatility expressed as a percentage
+    :param returns:
+        monthly returns expressed as a percentage to bootstrap from
+    :param paths:
+        number of simulated return paths
+    :param percentiles:
+        percentiles of the investment gains to report
+    :param seed:
+        seed of the random number generator
+    :param chunk_size:
+        number of paths simulated at a time
+    :return:
+        dict with the deterministic "interest_saved" and "months", the
+        "checkpoints" in months, the (len(percentiles), len(checkpoints))
+        "bands" of investment gains and the "probability" that the final gain
+        beats the interest saved
+    """
+
+    _, _, interest, _ = amortization(rate, number, principal)
+    _, p, i, _ = amortization(rate, number, principal, extra, extra_start)
+    interest_saved = np.sum(interest) - np.sum(i)
+    months = max(len(p[p > 0]) - extra_start, 1)
+
+    checkpoints, values = simulate_invest(
+        investments, months, extra, paths, invest_rate, volatility, returns,
+        seed=seed, chunk_size=chunk_size)
+    gains = values - investments
+
+    return {
+        "interest_saved": interest_saved,
+        "months": months,
+        "checkpoints": checkpoints,
+        "percentiles": np.asarray(percentiles),
+        "bands": np.percentile(gains, percentiles, axis=0),
+        "probability": np.mean(gains[:, -1] > interest_saved),
+    }
+
+
+# Columns written by sweep()
+SWEEP_COLUMNS = {
+    "payment": float,
+    "interest": float,
+    "interest_saved": float,
+    "months": int,
+    "months_saved": int,
+    "gain": float,
+}
+
+
+def _sweep_shard(output, lo, shard):
+    """Worker of :func:`sweep`, evaluates one shard of scenarios and writes
+    the results into its rows of the output files."""
+
+    t0 = time.perf_counter()
+    a, _, _, _, totals = amortization_batch(
+        shard["rate"], shard["number"], shard["principal"], shard["extra"],
+        shard["extra_start"])
+
+    # Invest for the months between the start of the extra payments and the
+    # payoff, as in the script below.
+    months = np.maximum(totals["months"] - shard["extra_start"], 0)
+    gain = invest(shard["invest_rate"], 12, shard["investments"], months / 12,
+                  shard["extra"]) - shard["investments"]
+
+    results = dict(totals, payment=a, gain=gain)
+    for name in SWEEP_COLUMNS:
+        column = np.load(os.path.join(output, name + ".npy"), mmap_mode="r+")
+        column[lo:lo + a.size] = results[name]
+        column.flush()
+        del column
+
+    return lo, a.size, time.perf_counter() - t0
+
+
+def sweep(scenarios, output, workers=None, shard_size=4096):
+    """Evaluates a large table of loan scenarios on a pool of processes.
+
+    The table is split into shards of shard_size scenarios that are evaluated
+    by :func:`amortization_batch` and :func:`invest` in the workers. Each
+    worker writes its rows straight into one .npy file per column of
+    SWEEP_COLUMNS in the output directory, so the results never sit in memory
+    as a whole; open them with np.load(..., mmap_mode="r").
+
+    :param scenarios:
+        mapping or structured array of equal-length columns "rate", "number",
+        "principal", "extra" and "extra_start", and optionally "investments"
+        (default 0) and "invest_rate" (default 10) for the gain of investing
+        the extra payments instead
+    :param output:
+        directory for the result files, created if missing
+    :param workers:
+        number of worker processes, defaults to the number of CPUs
+    :param shard_size:
+        number of scenarios per shard
+    :return:
+        list of (first row, rows, seconds) per shard, in order of completion
+    """
+
+    dtype = getattr(scenarios, "dtype", None)
+    names = dtype.names if dtype is not None else scenarios.keys()
+    n = len(scenarios["rate"])
+    table = {name: np.asarray(scenarios[name]) for name in
+             ("rate", "number", "principal", "extra", "extra_start")}
+    for name, default in (("investments", 0), ("invest_rate", 10)):
+        table[name] = (np.asarray(scenarios[name]) if name in names
+                       else np.full(n, default))
+
+    os.makedirs(output, exist_ok=True)
+    for name, dtype in SWEEP_COLUMNS.items():
+        np.lib.format.open_memmap(os.path.join(output, name + ".npy"),
+                                  mode="w+", dtype=dtype, shape=(n,))
+
+    timings = []
+    with ProcessPoolExecutor(workers) as pool:
+        jobs = [pool.submit(_sweep_shard, output, lo,
+                            {k: v[lo:lo + shard_size]
+                             for k, v in table.items()})
+                for lo in range(0, n, shard_size)]
+        for job in as_completed(jobs):
+            timings.append(job.result())
+
+    return timings
 
 
 if __name__ == "__main__":
@@ -116,4 +830,10 @@ if __name__ == "__main__":
     print("Investments after\n\t15 years:\t\t\t$ {:10.2f}".format(
         invest(r, n, investments, 9, extra, s)))
 
+    mc = monte_carlo(rate, term, loan, extra, extra_start, investments, r,
+                     percentiles=(5, 50, 95), seed=0)
+    print("Investment Gains, random returns:")
+    for q, band in zip(mc["percentiles"], mc["bands"]):
+        print("\t{:2d}th percentile:\t$ {:10.2f}".format(q, band[-1]))
+
     print(amount, principle[0])
\ No newline at end of file
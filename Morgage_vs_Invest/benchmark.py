@@ -0,0 +1,245 @@
+"""
+Benchmarks for the amortization and invest numerics in Morgage_vs_Invest.
+
+Measures single-call latency, batch throughput and peak memory for 15 and 30
+year loans with and without extra payments, and checks every implementation
+against the original per-period loops kept below. The amortization schedules
+have to match the loop to the cent. invest() only has to be within one cent:
+its closed form is more accurate than the loop, whose rounding error builds up
+over the periods, so the two can differ by a cent at large balances or with
+daily compounding. Results are written as JSON so runs on different commits
+can be compared:
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+
+from Morgage_vs_Invest import amortization, amortization_batch, invest
+
+
+def reference_amortization(rate, number, principal, extra=0, extra_start=0):
+    """Original per-period implementation of amortization()."""
+
+    r = rate / 12 / 100
+    i = np.zeros((number + 1,), dtype=float)
+    p = np.zeros((number + 1,), dtype=float)
+    bal = np.zeros((number + 1,), dtype=float)
+
+    a = np.round(principal * ((r * (1 + r) ** number) /
+                              ((1 + r) ** number - 1)), 2)
+
+    pay = np.ones((number + 1,), dtype=float) * a
+    pay[extra_start:] += extra
+
+    bal[0] = principal
+    for n in range(1, number):
+        i[n] = np.round(bal[n - 1] * r, 2)
+        p[n] = np.round(pay[n] - i[n], 2)
+
+        bal[n] = np.round(bal[n - 1] - p[n], 2)
+
+        if bal[n] < a:
+            n += 1
+            i[n] = np.round(bal[n - 1] * r, 2)
+            pay[n] = np.round(bal[n - 1] + i[n], 2)
+            p[n] = np.round(pay[n] - i[n], 2)
+            bal[n] = np.round(bal[n - 1] - p[n], 2)
+            break
+
+    return a, p[1:], i[1:], bal[1:]
+
+
+def reference_invest(rate, number, principal, years, extra=0):
+    """Original per-period implementation of invest()."""
+
+    r = rate / 100
+
+    a = principal
+    for i in range(int(number * years)):
+        a = a * (1 + r / number) + extra
+    a = np.round(a, 2)
+
+    return a
+
+
+def scenarios(size, term, extra, seed):
+    """Reproducible table of loans for one benchmark case."""
+
+    rng = np.random.default_rng(seed)
+    table = {
+        "rate": np.round(rng.uniform(2, 8, size), 3),
+        "number": np.full(size, term),
+        "principal": np.round(rng.uniform(1e5, 1e6, size), 2),
+        "extra": np.zeros(size),
+        "extra_start": np.zeros(size, dtype=int),
+    }
+    if extra:
+        table["extra"] = np.round(rng.uniform(100, 2000, size), 2)
+        table["extra_start"] = rng.integers(1, 60, size)
+    return table
+
+
+def check(table, samples):
+    """Compares amortization, amortization_batch and invest with the
+    reference loops on the first samples scenarios of the table, invest to
+    within one cent."""
+
+    table = {k: v[:samples] for k, v in table.items()}
+    a, p, i, bal, _ = amortization_batch(**table)
+    years = table["number"] / 12
+    fv = invest(table["rate"], 12, table["principal"], years, table["extra"])
+    for k in range(len(table["rate"])):
+        args = [table[name][k].item() for name in
+                ("rate", "number", "principal", "extra", "extra_start")]
+        ref = reference_amortization(*args)
+        for got in (amortization(*args), (a[k], p[k], i[k], bal[k])):
+            if not all(np.array_equal(x, y) for x, y in zip(ref, got)):
+                raise AssertionError("amortization{} differs from the "
+                                     "reference".format(tuple(args)))
+
+        # The loop accumulates rounding error over the periods, so the closed
+        # form of invest() can differ from it by a cent at large balances.
+        ref = reference_invest(args[0], 12, args[2], years[k], args[3])
+        if abs(fv[k] - ref) > 0.01:
+            raise AssertionError("invest{} differs from the reference".format(
+                (args[0], 12, args[2], years[k], args[3])))
+
+
+def latency(func, *args):
+    """Best time of a single call in seconds."""
+
+    timer = timeit.Timer(lambda: func(*args))
+    number, _ = timer.autorange()
+    return min(timer.repeat(3, number)) / number
+
+
+def run_batch(table, chunk):
+    """Evaluates a scenario table chunk at a time, as a sweep would, so the
+    largest sizes fit in memory."""
+
+    for lo in range(0, len(table["rate"]), chunk):
+        part = {k: v[lo:lo + chunk] for k, v in table.items()}
+        amortization_batch(**part)
+        invest(part["rate"], 12, part["principal"], part["number"] / 12,
+               part["extra"])
+
+
+def peak_memory(func, *args):
+    """Peak memory allocated while running func in bytes."""
+
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark(sizes, seed, chunk, samples, memory):
+    results = []
+    for term in (180, 360):
+        for extra in (False, True):
+            case = {"term": term, "extra": extra}
+            table = scenarios(max(sizes), term, extra, seed)
+            check(table, samples)
+
+            args = [table[name][0].item() for name in
+                    ("rate", "number", "principal", "extra", "extra_start")]
+            results.append(dict(case, name="amortization", size=1,
+                                seconds=latency(amortization.__wrapped__,
+                                                *args)))
+            results.append(dict(case, name="invest", size=1, seconds=latency(
+                invest, args[0], 12, args[2], term / 12, args[3])))
+            show(results[-2:])
+
+            for size in sizes:
+                part = {k: v[:size] for k, v in table.items()}
+                t0 = time.perf_counter()
+                run_batch(part, chunk)
+                seconds = time.perf_counter() - t0
+                result = dict(case, name="batch", size=size, seconds=seconds,
+                              per_second=size / seconds)
+                if memory:
+                    result["peak_bytes"] = peak_memory(run_batch, part, chunk)
+                results.append(result)
+                show(results[-1:])
+    return results
+
+
+def show(results):
+    for result in results:
+        print("{name:>12s} {term:3d} months extra={extra!s:5s} "
+              "{size:8d}: {seconds:9.6f} s".format(**result))
+
+
+def describe():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"],
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+    }
+
+
+def compare(results, baseline):
+    def key(result):
+        return (result["name"], result["term"], result["extra"],
+                result["size"])
+
+    before = {key(r): r["seconds"] for r in baseline["results"]}
+    print("\nspeedup against {}".format(baseline["meta"]["commit"] or "?"))
+    for result in results:
+        if key(result) in before:
+            print("{:>12s} {:3d} months extra={!s:5s} {:8d}: {:7.2f}x".format(
+                *key(result)[:3], result["size"],
+                before[key(result)] / result["seconds"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes",
+                        default="1,10,100,1000,10000,100000,1000000",
+                        help="comma separated numbers of scenarios")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk", type=int, default=16384,
+                        help="scenarios per amortization_batch call")
+    parser.add_argument("--samples", type=int, default=200,
+                        help="scenarios checked against the reference loops")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the peak memory measurement")
+    parser.add_argument("--output", help="JSON file for the results")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    args = parser.parse_args()
+
+    sizes = [int(float(s)) for s in args.sizes.split(",")]
+    results = benchmark(sizes, args.seed, args.chunk, args.samples,
+                        not args.no_memory)
+    report = {"meta": dict(describe(), seed=args.seed, sizes=sizes),
+              "results": results}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()